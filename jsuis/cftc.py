@@ -3,97 +3,441 @@ import requests
 import pandas as pd
 import re
 import os
+import json
+import hashlib
+import argparse
+import datetime
+import concurrent.futures
+import collections
+import mmap
 # os.chdir('H:/')
 
 
 # In[2]:
 
 
+USER_AGENT='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.121 Safari/537.36'
+CACHE_DIR='cache'
+MAX_DOWNLOADS=8
+
+_session=None
+
+
+#one keep-alive session for every request of the process
+def get_session():
+    global _session
+    if _session is None:
+        _session=requests.Session()
+        _session.headers.update({'User-Agent':USER_AGENT})
+        #backfill downloads share the session across threads
+        adapter=requests.adapters.HTTPAdapter(pool_maxsize=MAX_DOWNLOADS)
+        _session.mount('https://',adapter)
+        _session.mount('http://',adapter)
+    return _session
+
+
 #scraping function
-def scrape(url):
-    session=requests.Session()    
-    session.headers.update(
-            {'User-Agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.121 Safari/537.36'})    
-    response=session.get(url)    
+def scrape(url,headers=None):
+    response=get_session().get(url,headers=headers)    
     return response
 
+
+#cache files for a url: validators (json) and parsed frame (pickle)
+def cache_paths(url,cache_dir=CACHE_DIR):
+    key=hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return (os.path.join(cache_dir,key+'.json'),
+            os.path.join(cache_dir,key+'.pkl'))
+
+
+#conditional GET: re-download and re-parse only when the report changed
+def fetch(url,cache_dir=CACHE_DIR,layout=None):
+
+    meta_path,frame_path=cache_paths(url,cache_dir)
+    meta={}
+    if os.path.exists(meta_path) and os.path.exists(frame_path):
+        with open(meta_path,encoding='utf-8') as f:
+            meta=json.load(f)
+
+    headers={}
+    if meta.get('etag'):
+        headers['If-None-Match']=meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since']=meta['last_modified']
+
+    response=scrape(url,headers=headers)
+    if response.status_code==304 and meta:
+        return pd.read_pickle(frame_path)
+    response.raise_for_status()
+
+    df=etl(response,layout or LEGACY_FUTURES)
+
+    #frame first, validators last: a crash in between only costs a refetch
+    os.makedirs(cache_dir,exist_ok=True)
+    df.to_pickle(frame_path+'.tmp')
+    os.replace(frame_path+'.tmp',frame_path)
+    meta={'url':url,
+          'etag':response.headers.get('ETag'),
+          'last_modified':response.headers.get('Last-Modified')}
+    with open(meta_path+'.tmp','w',encoding='utf-8') as f:
+        json.dump(meta,f)
+    os.replace(meta_path+'.tmp',meta_path)
+
+    return df
+
+#block grammar shared by every exchange page and report family:
+#a header line opens a block, then each section is found by its marker
+#line (named groups are captured from it) followed, when the section has
+#fields, by the first numeric row that matches the section's row filter.
+#the grammar runs on bytes so reports are parsed without decoding them
+Section=collections.namedtuple('Section',['marker','fields','row'])
+Layout=collections.namedtuple('Layout',['report','sections','columns','date_format'])
+
+HEADER_RE=re.compile(rb'^\s*(?:<[^>]+>\s*)*(?P<commodity>.+?)\s+-\s+(?P<exchange>[^-]+?)\s+Code-(?P<commodity_code>\S+)')
+NUMBER_RE=re.compile(rb'-?\d[\d,]*(?:\.\d+)?|(?<!\S)\.(?!\S)')
+ALL_ROW=re.compile(rb'^\s*All\s*:')
+LINE_RE=re.compile(rb'[^\r\n]+')
+ENCODING='utf-8'
+
+SHORT_DATE=r'\d{2}/\d{2}/\d{2}'
+LONG_DATE=r'[A-Z][a-z]+ \d{1,2}, \d{4}'
+
+
+#precompile a layout; sections are (marker, fields, row) in report order
+def compile_layout(report,sections,date_format):
+    compiled=tuple(Section(re.compile(marker.encode('ascii')),tuple(fields),row)
+                   for marker,fields,row in sections)
+    columns=['commodity','exchange','commodity_code']
+    for section in compiled:
+        columns+=[g for g in section.marker.groupindex if g not in columns]
+        columns+=list(section.fields)
+    return Layout(report,compiled,columns,date_format)
+
+
+#legacy report: non-commercial / commercial / non-reportable
+CATEGORIES=['non_commercial_long','non_commercial_short',
+            'non_commercial_spread','commercial_long','commercial_short',
+            'total_long','total_short','non_reportable_long',
+            'non_reportable_short']
+LEGACY_SECTIONS=[
+    (rf'(?P<date>{SHORT_DATE})',(),None),
+    (r'\((?P<contractunit>.*)\)\s*OPEN INTEREST:\s*(?P<open_interest>\S+)',(),None),
+    (r'^\s*COMMITMENTS',[f'{c}_commitment' for c in CATEGORIES],None),
+    (rf'CHANGES FROM\s+(?P<changedate>{SHORT_DATE}).*:\s*(?P<change_open_interest>[^\s)]+)',
+     [f'{c}_change' for c in CATEGORIES],None),
+    (r'PERCENT OF OPEN INTEREST',[f'{c}_percent' for c in CATEGORIES],None),
+    (r'TOTAL TRADERS:\s*(?P<totaltraders>[^\s)]+)',[f'{c}_traders' for c in CATEGORIES[:7]],None),
+]
+
+
+#disaggregated and TFF reports share one shape: open interest, the
+#long/short categories, the long/short/spreading ones, nonreportables,
+#then the same categories again for changes, percents and trader counts
+def category_sections(unspread,spreading):
+    positions=[]
+    for c in unspread:
+        positions+=[f'{c}_long',f'{c}_short']
+    for c in spreading:
+        positions+=[f'{c}_long',f'{c}_short',f'{c}_spread']
+    nonreportable=['nonrept_long','nonrept_short']
+    return [
+        (rf'(?P<date>{LONG_DATE})',(),None),
+        (r'\((?P<contractunit>[^)]*)\)',
+         ['open_interest']+[f'{c}_commitment' for c in positions+nonreportable],ALL_ROW),
+        (rf'Changes in Commitments from:\s*(?P<changedate>{LONG_DATE})',
+         ['change_open_interest']+[f'{c}_change' for c in positions+nonreportable],None),
+        (r'Percent of Open Interest',
+         ['open_interest_percent']+[f'{c}_percent' for c in positions+nonreportable],ALL_ROW),
+        (r'Number of Traders in Each Category',
+         ['totaltraders']+[f'{c}_traders' for c in positions],ALL_ROW),
+    ]
+
+
+LEGACY_FUTURES=compile_layout('legacy_futures',LEGACY_SECTIONS,'%m/%d/%y')
+LEGACY_COMBINED=compile_layout('legacy_combined',LEGACY_SECTIONS,'%m/%d/%y')
+DISAGGREGATED_FUTURES=compile_layout('disaggregated_futures',
+    category_sections(['prod_merc'],['swap','m_money','other_rept']),'%B %d, %Y')
+DISAGGREGATED_COMBINED=DISAGGREGATED_FUTURES._replace(report='disaggregated_combined')
+TFF_FUTURES=compile_layout('tff_futures',
+    category_sections([],['dealer','asset_mgr','lev_money','other_rept']),'%B %d, %Y')
+TFF_COMBINED=TFF_FUTURES._replace(report='tff_combined')
+
+#the legacy CME futures-only page keeps its historical column layout
+COLUMNS=LEGACY_FUTURES.columns
+
+#every page of the weekly release and the layout its blocks follow
+PAGES={
+    'https://www.cftc.gov/dea/futures/deacbtsf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/futures/deacmesf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/futures/deanymesf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/futures/deacmxsf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/futures/deanybtsf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/futures/deamgesf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/futures/deacboesf.htm':LEGACY_FUTURES,
+    'https://www.cftc.gov/dea/options/deacbtsof.htm':LEGACY_COMBINED,
+    'https://www.cftc.gov/dea/options/deacmesof.htm':LEGACY_COMBINED,
+    'https://www.cftc.gov/dea/options/deanymesof.htm':LEGACY_COMBINED,
+    'https://www.cftc.gov/dea/options/deacmxsof.htm':LEGACY_COMBINED,
+    'https://www.cftc.gov/dea/options/deanybtsof.htm':LEGACY_COMBINED,
+    'https://www.cftc.gov/dea/options/deamgesof.htm':LEGACY_COMBINED,
+    'https://www.cftc.gov/dea/futures/ag_sf.htm':DISAGGREGATED_FUTURES,
+    'https://www.cftc.gov/dea/futures/petroleum_sf.htm':DISAGGREGATED_FUTURES,
+    'https://www.cftc.gov/dea/futures/nat_gas_sf.htm':DISAGGREGATED_FUTURES,
+    'https://www.cftc.gov/dea/futures/electricity_sf.htm':DISAGGREGATED_FUTURES,
+    'https://www.cftc.gov/dea/futures/other_sf.htm':DISAGGREGATED_FUTURES,
+    'https://www.cftc.gov/dea/options/ag_sof.htm':DISAGGREGATED_COMBINED,
+    'https://www.cftc.gov/dea/options/petroleum_sof.htm':DISAGGREGATED_COMBINED,
+    'https://www.cftc.gov/dea/options/nat_gas_sof.htm':DISAGGREGATED_COMBINED,
+    'https://www.cftc.gov/dea/options/electricity_sof.htm':DISAGGREGATED_COMBINED,
+    'https://www.cftc.gov/dea/options/other_sof.htm':DISAGGREGATED_COMBINED,
+    'https://www.cftc.gov/dea/futures/financial_lf.htm':TFF_FUTURES,
+    'https://www.cftc.gov/dea/options/financial_lof.htm':TFF_COMBINED,
+}
+
+#column dtypes of the etl output, by name
+CATEGORICAL_COLUMNS=['report','commodity','exchange','commodity_code']
+DATE_COLUMNS=['date','changedate']
+TEXT_COLUMNS=['contractunit']
+
+
+#parse the lines of one block against the layout's sections
+def parse_block(block,layout):
+
+    header=HEADER_RE.search(block[0])
+    record=header.groupdict()
+    sections=iter(layout.sections)
+    section=next(sections)
+    awaiting=None
+
+    for line in block[1:]:
+        if awaiting is not None:
+            if awaiting.row is not None and not awaiting.row.search(line):
+                continue
+            tokens=NUMBER_RE.findall(line)
+            if not tokens:
+                continue
+            #a row that does not fill the section exactly would shift every later column
+            if len(tokens)!=len(awaiting.fields):
+                raise ValueError(f'malformed block for {record["commodity"]!r}: '
+                                 f'{len(tokens)} numbers for {len(awaiting.fields)} columns')
+            record.update(zip(awaiting.fields,tokens))
+            awaiting=None
+        elif section is not None:
+            match=section.marker.search(line)
+            if match is None:
+                continue
+            record.update(match.groupdict())
+            if section.fields:
+                awaiting=section
+            section=next(sections,None)
+
+        if section is None and awaiting is None:
+            #'.' marks an empty cell in the cftc tables
+            return [record[c].strip() if record[c]!=b'.' else b'0' for c in layout.columns]
+
+    #block cut short before its last section
+    return None
+
+
+#non-empty lines of a buffer as zero-copy slices, never as a full list
+def iter_lines(buffer):
+    view=memoryview(buffer)
+    for match in LINE_RE.finditer(view):
+        yield view[match.start():match.end()]
+
+
+#single forward pass over the report lines (bytes-like), one record per
+#block; only the lines of the current block are held at any time
+def iter_blocks(lines,layout=LEGACY_FUTURES):
+
+    block=None
+    for line in lines:
+        if HEADER_RE.search(line):
+            #a new header always closes the previous block
+            if block is not None:
+                record=parse_block(block,layout)
+                if record is not None:
+                    yield record
+            block=[line]
+        elif block is not None:
+            block.append(line)
+
+    if block is not None:
+        record=parse_block(block,layout)
+        if record is not None:
+            yield record
+
+
+#build the typed frame column by column from parsed records
+def to_frame(records,layout=LEGACY_FUTURES):
+
+    columns=layout.columns
+    #transpose once: one tuple of raw strings per column
+    raw=dict(zip(columns,list(zip(*records)) or [()]*len(columns)))
+
+    data={}
+    for name in columns:
+        values=pd.Series(raw[name],dtype='object').str.decode(ENCODING)
+        if name in CATEGORICAL_COLUMNS:
+            data[name]=values.astype('category')
+        elif name in DATE_COLUMNS:
+            data[name]=pd.to_datetime(values,format=layout.date_format)
+        elif name in TEXT_COLUMNS:
+            data[name]=values.astype('string')
+        elif name.endswith('_percent'):
+            data[name]=pd.to_numeric(values).astype('float32')
+        else:
+            values=values.str.replace(',','',regex=False)
+            data[name]=pd.to_numeric(values).astype('int64')
+
+    return pd.DataFrame(data,columns=columns)
+
+
+#parse raw report bytes (top level so a process pool can pickle it)
+def parse(content,layout=LEGACY_FUTURES):
+    return to_frame(iter_blocks(iter_lines(content),layout),layout)
+
+
+#parse a report file through a read-only memory map
+def parse_file(path,layout=LEGACY_FUTURES):
+    with open(path,'rb') as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mapped:
+        return to_frame(iter_blocks(iter_lines(mapped),layout),layout)
+
+
 #get data
-def etl(response):
+def etl(response,layout=LEGACY_FUTURES):
+    return parse(response.content,layout)
+
+
+#fetch every page of the weekly release concurrently into one table
+def release(pages=PAGES,cache_dir=CACHE_DIR,max_downloads=MAX_DOWNLOADS):
+
+    frames=[]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_downloads) as executor:
+        futures={executor.submit(fetch,url,cache_dir,layout):(url,layout)
+                 for url,layout in pages.items()}
+        for future in concurrent.futures.as_completed(futures):
+            url,layout=futures[future]
+            try:
+                df=future.result()
+            except Exception as e:
+                print(f'failed to load {url}: {e}')
+                continue
+            frames.append(df.assign(report=layout.report))
+
+    if not frames:
+        return pd.DataFrame()
+
+    #counts missing from a family stay integer as nullable Int64
+    frames=[df.astype({c:'Int64' for c,t in df.dtypes.items() if t=='int64'})
+            for df in frames]
+    df=pd.concat(frames,ignore_index=True)
+    columns=['report']+[c for c in df.columns if c!='report']
+    df=df[columns].astype({c:'category' for c in CATEGORICAL_COLUMNS})
+    return df
     
-    #create a list
-    text=response.content.decode('utf-8').split('\r')  
-    print(type(text))
-    #create index for each block
-    assets=[i for i in text if 'CHICAGO MERCANTILE EXCHANGE' in i]
-    ind=[text.index(i) for i in assets]
-
-    overall = []
-
-    #etl
-    for i in ind:
-        
-        commodity=text[i].split(' - CHICAGO MERCANTILE EXCHANGE')[0].replace('\n','')
-        commodity_code=text[i].split('Code-')[-1].replace('\n','')
-        date=re.search('\d{2}\/\d{2}\/\d{2}',text[i+1]).group()
-        contractunit=re.search('(?<=\().*(?=OPEN INTEREST)',text[i+7]).group().replace(')','')
-        open_interest=re.search('(?<=OPEN INTEREST\:).*',text[i+7]).group()
-        non_commercial_long_commitment,non_commercial_short_commitment, \
-        non_commercial_spread_commitment,commercial_long_commitment, \
-        commercial_short_commitment,total_long_commitment,total_short_commitment, \
-        non_reportable_long_commitment,non_reportable_short_commitment=re.findall('\S+',text[i+9])
-        changedate=re.search('\d{2}\/\d{2}\/\d{2}',text[i+11]).group()
-        change_open_interest=text[i+11].split(' ')[-1].replace(')','')
-        non_commercial_long_change,non_commercial_short_change, \
-        non_commercial_spread_change,commercial_long_change, \
-        commercial_short_change,total_long_change,total_short_change, \
-        non_reportable_long_change,non_reportable_short_change=re.findall('\S+',text[i+12])
-        non_commercial_long_percent,non_commercial_short_percent, \
-        non_commercial_spread_percent,commercial_long_percent, \
-        commercial_short_percent,total_long_percent,total_short_percent, \
-        non_reportable_long_percent,non_reportable_short_percent=re.findall('\S+',text[i+15])
-        totaltraders=text[i+17].split(' ')[-1].replace(')','')
-        non_commercial_long_traders,non_commercial_short_traders, \
-        non_commercial_spread_traders,commercial_long_traders, \
-        commercial_short_traders,total_long_traders,total_short_traders=re.findall('\S+',text[i+18])
-        
-        temp=[commodity,commodity_code,date,contractunit,open_interest,
-              non_commercial_long_commitment,non_commercial_short_commitment,
-              non_commercial_spread_commitment,commercial_long_commitment,
-              commercial_short_commitment,total_long_commitment,
-              total_short_commitment,non_reportable_long_commitment,
-              non_reportable_short_commitment,changedate,change_open_interest,
-              non_commercial_long_change,non_commercial_short_change,
-              non_commercial_spread_change,commercial_long_change,
-              commercial_short_change,total_long_change,total_short_change,
-              non_reportable_long_change,non_reportable_short_change,
-              non_commercial_long_percent,non_commercial_short_percent,
-              non_commercial_spread_percent,commercial_long_percent,
-              commercial_short_percent,total_long_percent,
-              total_short_percent,non_reportable_long_percent,
-              non_reportable_short_percent,totaltraders,
-              non_commercial_long_traders,non_commercial_short_traders,
-              non_commercial_spread_traders,commercial_long_traders,
-              commercial_short_traders,total_long_traders,total_short_traders]
-        
-        overall+=temp
-    return text 
+
+# In[3]:
+
+
+#weekly reports archived by cftc.gov, one directory per year
+ARCHIVE_URL='https://www.cftc.gov/sites/default/files/files/dea/cotarchives/{date:%Y}/futures/deacmesf{date:%m%d%y}.htm'
+PARQUET_DIR='cot_parquet'
+PARTITION_COLUMNS=['year','commodity_code']
+
+
+#report dates (tuesdays) between start and end, inclusive
+def report_dates(start,end):
+    first=start+datetime.timedelta(days=(1-start.weekday())%7)
+    return [first+datetime.timedelta(weeks=w)
+            for w in range((end-first).days//7+1)]
+
+
+#download one archived report, None when that week was not published
+def download(url):
+    response=scrape(url)
+    if response.status_code==404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+#write one parsed report into the partitioned store
+def write_partitions(df,date,out_dir=PARQUET_DIR):
+    df=df.assign(year=df['date'].dt.year)
+    #one file per report and partition: rerunning a range overwrites it
+    df.to_parquet(out_dir,partition_cols=PARTITION_COLUMNS,index=False,
+                  basename_template=f'deacmesf{date:%Y%m%d}-{{i}}.parquet',
+                  existing_data_behavior='overwrite_or_ignore')
+
+
+#download archived reports over a thread pool, parse them over a process pool
+def backfill(start,end,out_dir=PARQUET_DIR,max_downloads=MAX_DOWNLOADS,max_parsers=None):
+
+    urls={ARCHIVE_URL.format(date=d):d for d in report_dates(start,end)}
+    written=0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_downloads) as downloads, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=max_parsers) as parsers:
+
+        fetching={downloads.submit(download,url):url for url in urls}
+        parsing={}
+
+        for future in concurrent.futures.as_completed(fetching):
+            url=fetching[future]
+            try:
+                content=future.result()
+            except requests.RequestException as e:
+                print(f'failed to download {url}: {e}')
+                continue
+            if content is None:
+                print(f'no report published for {urls[url]}')
+                continue
+            parsing[parsers.submit(parse,content)]=url
+
+        for future in concurrent.futures.as_completed(parsing):
+            url=parsing[future]
+            try:
+                df=future.result()
+            except Exception as e:
+                print(f'failed to parse {url}: {e}')
+                continue
+            write_partitions(df,urls[url],out_dir)
+            written+=1
+
+    print(f'backfilled {written} of {len(urls)} weekly reports into {out_dir}')
+    return written
+
     
 # In[4]:
 
 def main():
 
+    parser=argparse.ArgumentParser(description='CFTC Commitments of Traders report')
+    parser.add_argument('--backfill',nargs=2,metavar=('START','END'),
+                        type=datetime.date.fromisoformat,
+                        help='load archived reports between two YYYY-MM-DD dates')
+    parser.add_argument('--out',default=PARQUET_DIR,help='parquet store for --backfill')
+    parser.add_argument('--release',action='store_true',
+                        help='every exchange page and report family in one table')
+    parser.add_argument('--workers',type=int,default=MAX_DOWNLOADS,help='concurrent downloads')
+    args=parser.parse_args()
+
+    if args.backfill:
+        backfill(*args.backfill,out_dir=args.out,max_downloads=args.workers)
+        return
+
+    if args.release:
+        df=release(max_downloads=args.workers)
+        df.to_csv('trader commitment release.csv',index=False)
+        return
+
     # url='https://books.toscrape.com/catalogue/page-1.html'
     url='https://www.cftc.gov/dea/futures/deacmesf.htm'
     
-    #scrape
-    response=scrape(url)
-
-    #get data
-    df=etl(response)
-    with open("output.txt", "w", encoding="utf-8") as f:
-      f.write("\n".join(df))
+    #scrape and get data, served from the cache while the report is unchanged
+    df=fetch(url)
 
-    # df.to_csv('trader commitment report.csv',index=False)
+    df.to_csv('trader commitment report.csv',index=False)
     
 
 if __name__ == "__main__":
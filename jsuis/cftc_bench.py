@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import cftc
+
+
+#one legacy futures-only block, laid out exactly like deacmesf.htm
+BLOCK_TEMPLATE='''{commodity} - CHICAGO MERCANTILE EXCHANGE                         Code-{code}
+FUTURES ONLY POSITIONS AS OF {date}                          |
+-------------------------------------------------------------------------------
+   NON-COMMERCIAL         |   COMMERCIAL    |      TOTAL      |  NONREPORTABLE
+--------------------------|-----------------|-----------------|    POSITIONS
+  LONG  | SHORT  |SPREADS |  LONG  | SHORT  |  LONG  | SHORT  |  LONG  | SHORT
+-------------------------------------------------------------------------------
+(CONTRACTS OF {unit})                           OPEN INTEREST: {open_interest:>12,}
+COMMITMENTS
+{commitments}
+
+CHANGES FROM {changedate} (CHANGE IN OPEN INTEREST: {change_open_interest:>11,})
+{changes}
+
+PERCENT OF OPEN INTEREST FOR EACH CATEGORY OF TRADERS
+{percents}
+
+NUMBER OF TRADERS IN EACH CATEGORY (TOTAL TRADERS: {totaltraders:>5,})
+{traders}
+'''
+
+NOISE_LINES=['',
+             '-------------------------------------------------------------------------------',
+             ' * Open interest is adjusted for spreading positions.',
+             '<p>Updated weekly</p>']
+
+MODES=['bytes','mmap','stream','blocks']
+
+
+#right-aligned row of numbers, same column width as the cftc tables
+def row(values,fmt='{:>9,}'):
+    return ''.join(fmt.format(v) for v in values)
+
+
+#synthetic report with n_blocks commodity blocks and optional noise lines
+def synthetic_report(n_blocks,noise=0,seed=0):
+
+    rng=random.Random(seed)
+    parts=['<html><body><pre>']
+    for i in range(n_blocks):
+        commitments=[rng.randint(0,500000) for _ in range(9)]
+        parts.append(BLOCK_TEMPLATE.format(
+            commodity=f'SYNTHETIC {i}',
+            code=f'{i:06d}',
+            date='09/30/25',
+            unit=f'{rng.randint(1,100)*1000:,} UNITS',
+            open_interest=sum(commitments[:5]),
+            commitments=row(commitments),
+            changedate='09/23/25',
+            change_open_interest=rng.randint(-50000,50000),
+            changes=row(rng.randint(-50000,50000) for _ in range(9)),
+            percents=row((rng.uniform(0,100) for _ in range(9)),'{:>9.1f}'),
+            totaltraders=rng.randint(10,500),
+            traders=row(rng.randint(0,300) for _ in range(7))))
+        parts+=[rng.choice(NOISE_LINES) for _ in range(noise)]
+    parts.append('</pre></body></html>')
+    return '\n'.join(parts).replace('\n','\r\n').encode('utf-8')
+
+
+#run one parser mode over the report file
+def run_mode(mode,path):
+
+    if mode=='bytes':
+        with open(path,'rb') as f:
+            return len(cftc.parse(f.read()))
+    if mode=='mmap':
+        return len(cftc.parse_file(path))
+    if mode=='stream':
+        with open(path,'rb') as f:
+            return len(cftc.to_frame(cftc.iter_blocks(f)))
+    if mode=='blocks':
+        with open(path,'rb') as f:
+            return sum(1 for _ in cftc.iter_blocks(f))
+    raise ValueError(f'unknown parser mode {mode!r}')
+
+
+#best wall time over repeats, then one traced run for peak memory
+def measure(mode,path,n_blocks,repeat=3):
+
+    timings=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        parsed=run_mode(mode,path)
+        timings.append(time.perf_counter()-start)
+    if parsed!=n_blocks:
+        raise RuntimeError(f'{mode}: parsed {parsed} of {n_blocks} blocks')
+
+    tracemalloc.start()
+    try:
+        run_mode(mode,path)
+        peak=tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    seconds=min(timings)
+    size=os.path.getsize(path)
+    return {'mode':mode,
+            'seconds':seconds,
+            'blocks_per_sec':n_blocks/seconds,
+            'mb_per_sec':size/1e6/seconds,
+            'peak_memory_mb':peak/1e6}
+
+
+def benchmark(sizes,noise=0,modes=MODES,repeat=3,seed=0):
+
+    results=[]
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_blocks in sizes:
+            path=os.path.join(tmp,f'report_{n_blocks}.htm')
+            with open(path,'wb') as f:
+                f.write(synthetic_report(n_blocks,noise,seed))
+            size=os.path.getsize(path)
+            for mode in modes:
+                result=measure(mode,path,n_blocks,repeat)
+                result.update(blocks=n_blocks,noise=noise,report_mb=size/1e6)
+                results.append(result)
+                print(f"{mode:>7} {n_blocks:>8} blocks {result['blocks_per_sec']:>12,.0f} blocks/s "
+                      f"{result['mb_per_sec']:>8.1f} MB/s {result['peak_memory_mb']:>8.2f} MB peak")
+
+    return {'created_at':time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python':platform.python_version(),
+            'pandas':pd.__version__,
+            'machine':platform.machine(),
+            'results':results}
+
+
+def main():
+
+    parser=argparse.ArgumentParser(description='Throughput benchmark for cftc.etl')
+    parser.add_argument('--blocks',type=int,nargs='+',default=[100,1000,10000],
+                        help='commodity blocks per synthetic report')
+    parser.add_argument('--noise',type=int,default=0,help='noise lines after each block')
+    parser.add_argument('--modes',nargs='+',choices=MODES,default=MODES)
+    parser.add_argument('--repeat',type=int,default=3)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--out',default='cftc_bench.json',help='json results file')
+    args=parser.parse_args()
+
+    report=benchmark(args.blocks,args.noise,args.modes,args.repeat,args.seed)
+    with open(args.out,'w',encoding='utf-8') as f:
+        json.dump(report,f,indent=2)
+    print(f'results saved to {args.out}')
+
+
+if __name__ == "__main__":
+    main()
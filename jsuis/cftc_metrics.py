@@ -0,0 +1,135 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import cftc
+
+
+WINDOW=156        #three years of weekly reports
+MIN_PERIODS=52
+
+#net position = long - short for each trader category of the legacy report
+NET_POSITIONS={
+    'net_non_commercial':('non_commercial_long_commitment','non_commercial_short_commitment'),
+    'net_commercial':('commercial_long_commitment','commercial_short_commitment'),
+    'net_non_reportable':('non_reportable_long_commitment','non_reportable_short_commitment'),
+}
+#the same nets from the report's own week-over-week change columns
+NET_CHANGES={
+    'net_non_commercial_change':('non_commercial_long_change','non_commercial_short_change'),
+    'net_commercial_change':('commercial_long_change','commercial_short_change'),
+    'net_non_reportable_change':('non_reportable_long_change','non_reportable_short_change'),
+}
+
+
+#scatter long-format columns into dense (dates x commodities) float arrays
+def to_panel(df,columns):
+
+    dates,date_index=np.unique(df['date'].to_numpy(),return_inverse=True)
+    codes,code_index=np.unique(df['commodity_code'].astype(str).to_numpy(),return_inverse=True)
+
+    panel={}
+    for column in columns:
+        values=np.full((len(dates),len(codes)),np.nan)
+        values[date_index,code_index]=df[column].to_numpy(dtype='float64',na_value=np.nan)
+        panel[column]=values
+    present=np.zeros((len(dates),len(codes)),dtype=bool)
+    present[date_index,code_index]=True
+    return dates,codes,panel,present
+
+
+#week-over-week difference along the date axis, NaN for the first week
+def delta(values):
+    out=np.full_like(values,np.nan)
+    out[1:]=values[1:]-values[:-1]
+    return out
+
+
+#trailing window sums of each column, ignoring NaN, via cumulative sums
+def rolling_sum(values,window):
+    cumsum=np.cumsum(values,axis=0)
+    out=cumsum.copy()
+    out[window:]-=cumsum[:-window]
+    return out
+
+
+#z-score of each week against its trailing window
+def rolling_zscore(values,window=WINDOW,min_periods=MIN_PERIODS):
+
+    valid=~np.isnan(values)
+    filled=np.where(valid,values,0.0)
+    count=rolling_sum(valid.astype('float64'),window)
+    total=rolling_sum(filled,window)
+    squares=rolling_sum(filled*filled,window)
+
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean=total/count
+        var=(squares-count*mean*mean)/(count-1)
+        z=(values-mean)/np.sqrt(np.maximum(var,0.0))
+    z[(count<min_periods)|~valid]=np.nan
+    z[np.isinf(z)]=np.nan
+    return z
+
+
+#percentile rank (0-1) of each week within its trailing window
+def rolling_percentile(values,window=WINDOW,min_periods=MIN_PERIODS):
+
+    padded=np.concatenate([np.full((window-1,values.shape[1]),np.nan),values])
+    #(dates, commodities, window) view, no copy
+    windows=np.lib.stride_tricks.sliding_window_view(padded,window,axis=0)
+    current=values[:,:,None]
+
+    with np.errstate(invalid='ignore'):
+        count=np.sum(~np.isnan(windows),axis=2)
+        below=np.sum(windows<=current,axis=2)
+        rank=below/count
+    rank[(count<min_periods)|np.isnan(values)]=np.nan
+    return rank
+
+
+#every derived metric for every commodity in one vectorized pass
+def compute(df,window=WINDOW,min_periods=MIN_PERIODS):
+
+    inputs=sorted({c for pair in (*NET_POSITIONS.values(),*NET_CHANGES.values()) for c in pair}
+                  |{'open_interest'})
+    dates,codes,panel,present=to_panel(df,inputs)
+
+    metrics={}
+    for name,(long,short) in NET_POSITIONS.items():
+        net=panel[long]-panel[short]
+        metrics[name]=net
+        metrics[f'{name}_delta']=delta(net)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            metrics[f'{name}_pct_oi']=net/panel['open_interest']
+        metrics[f'{name}_zscore']=rolling_zscore(net,window,min_periods)
+        metrics[f'{name}_percentile']=rolling_percentile(net,window,min_periods)
+    for name,(long,short) in NET_CHANGES.items():
+        metrics[name]=panel[long]-panel[short]
+
+    #back to long format, one row per reported (date, commodity)
+    date_index,code_index=np.nonzero(present)
+    data={'commodity_code':pd.Categorical(codes[code_index]),
+          'date':dates[date_index]}
+    for name,values in metrics.items():
+        data[name]=values[date_index,code_index].astype('float32')
+    return pd.DataFrame(data)
+
+
+def main():
+
+    parser=argparse.ArgumentParser(description='Derived COT positioning metrics')
+    parser.add_argument('--store',default=cftc.PARQUET_DIR,help='parquet store written by cftc.py --backfill')
+    parser.add_argument('--window',type=int,default=WINDOW)
+    parser.add_argument('--min-periods',type=int,default=MIN_PERIODS)
+    parser.add_argument('--out',default='cot_metrics.parquet')
+    args=parser.parse_args()
+
+    df=pd.read_parquet(args.store)
+    metrics=compute(df,args.window,args.min_periods)
+    metrics.to_parquet(args.out,index=False)
+    print(f'{len(metrics)} rows of metrics saved to {args.out}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import cftc
+
+
+STORE_DIR='cot_store'
+INDEX_FILE='index.json'
+DATE_DTYPE='datetime64[D]'
+MIN_CAPACITY=64
+#layout of every report family, by the name release() puts in 'report'
+LAYOUTS={layout.report:layout for layout in cftc.PAGES.values()}
+
+
+class COTStore:
+    """
+    Per-commodity time series of parsed COT reports, one set per report family.
+
+    Every (report, commodity) pair gets a directory with one .npy file per
+    numeric column plus the report dates, each a contiguous memory-mapped
+    array sorted by date. index.json maps 'report/code' keys to their row
+    count, capacity and columns, so a lookup is a dict access plus a binary
+    search on dates. Rows are keyed on (report, commodity_code, date):
+    appending a week twice overwrites it instead of duplicating it, and the
+    futures-only and combined reports of a commodity never mix.
+    """
+
+    def __init__(self,root=STORE_DIR):
+        self.root=root
+        self.index_path=os.path.join(root,INDEX_FILE)
+        self.index={}
+        self.arrays={}
+        os.makedirs(root,exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path,encoding='utf-8') as f:
+                self.index=json.load(f)
+
+    def path(self,key,column):
+        return os.path.join(self.root,key,column+'.npy')
+
+    def entry(self,report,code):
+        key=f'{report}/{code}'
+        if key not in self.index:
+            raise KeyError(f'no {report} series for commodity {code}')
+        return key,self.index[key]
+
+    def array(self,key,column,mode='r+'):
+        """Memory-mapped full-capacity array of one column"""
+        if (key,column) not in self.arrays:
+            self.arrays[key,column]=np.load(self.path(key,column),mmap_mode=mode)
+        return self.arrays[key,column]
+
+    def allocate(self,key,columns,dtypes,capacity,rows=None):
+        """(Re)create the arrays of a series with the given capacity"""
+        os.makedirs(os.path.join(self.root,key),exist_ok=True)
+        for column in columns:
+            old=rows[column] if rows is not None else None
+            self.arrays.pop((key,column),None)
+            tmp=self.path(key,column)+'.tmp'
+            array=np.lib.format.open_memmap(tmp,mode='w+',dtype=dtypes[column],shape=(capacity,))
+            if old is not None:
+                array[:len(old)]=old
+            array.flush()
+            del array
+            os.replace(tmp,self.path(key,column))
+
+    def append(self,df,report=None):
+        """Insert or overwrite one or more weekly reports of one report family
+
+        The family comes from the frame's 'report' column (cftc.release()),
+        else from report, else it is the legacy futures-only report that
+        cftc.fetch() parses by default. A cftc.release() frame holds several
+        families as nullable Int64 columns, each family missing the others'
+        columns: select one family first. Only its layout's columns are
+        stored, and a missing value in them is an error since the arrays have
+        no missing value marker.
+        """
+        if 'report' in df.columns and len(df):
+            reports=df['report'].unique()
+            if len(reports)>1:
+                raise ValueError(f'frame holds reports {sorted(reports)}; append one at a time, '
+                                 f'e.g. df[df["report"]=="legacy_futures"]')
+            if report is not None and report!=reports[0]:
+                raise ValueError(f'frame holds the {reports[0]} report, not {report}')
+            report=reports[0]
+        report=report or cftc.LEGACY_FUTURES.report
+        if report not in LAYOUTS:
+            raise ValueError(f'unknown report {report!r}; expected one of {sorted(LAYOUTS)}')
+        layout=LAYOUTS[report]
+
+        #a frame of another family lacks this layout's columns or fills others
+        absent=[c for c in layout.columns if c not in df.columns]
+        foreign=[c for c in df.columns if c not in layout.columns and c!='report'
+                 and pd.api.types.is_numeric_dtype(df[c]) and df[c].notna().any()]
+        if absent or foreign:
+            raise ValueError(f'frame does not match the {report} layout: '
+                             f'missing {absent[:3]}, unexpected {foreign[:3]}')
+
+        numeric=[c for c in layout.columns if c!='date' and pd.api.types.is_numeric_dtype(df[c])]
+        missing=[c for c in numeric if df[c].isna().any()]
+        if missing:
+            raise ValueError(f'missing values in {missing}')
+        columns=['date']+numeric
+        dtypes={'date':DATE_DTYPE,**{c:df[c].dtype.numpy_dtype
+                if hasattr(df[c].dtype,'numpy_dtype') else df[c].dtype for c in numeric}}
+
+        for code,group in df.groupby('commodity_code',observed=True,sort=False):
+            key=f'{report}/{code}'
+            #the last row of a week wins when a frame repeats it
+            group=group.drop_duplicates('date',keep='last').sort_values('date')
+            entry=self.index.get(key)
+            if entry is None:
+                entry={'report':report,'commodity':str(group['commodity'].iloc[-1]),'rows':0,
+                       'capacity':0,'columns':columns}
+                self.index[key]=entry
+            elif entry['columns']!=columns:
+                raise ValueError(f'{key}: columns differ from the stored series')
+
+            new={c:group[c].to_numpy(dtype=dtypes[c]) for c in columns}
+            self.merge(key,entry,new,dtypes)
+
+        self.flush()
+
+    def merge(self,key,entry,new,dtypes):
+        """Merge sorted new rows of one series into its arrays"""
+        columns=entry['columns']
+        rows=entry['rows']
+        dates=self.array(key,'date')[:rows] if rows else np.empty(0,DATE_DTYPE)
+
+        pos=np.searchsorted(dates,new['date'])
+        hit=pos<rows
+        hit[hit]=dates[pos[hit]]==new['date'][hit]
+        fresh=~hit
+        last=dates[-1] if rows else None
+        #no view may outlive a remap below (windows cannot replace mapped files)
+        del dates
+
+        #weeks already stored are overwritten in place
+        if hit.any():
+            for column in columns:
+                self.array(key,column)[pos[hit]]=new[column][hit]
+
+        if not fresh.any():
+            return
+
+        added={c:new[c][fresh] for c in columns}
+        total=rows+int(fresh.sum())
+        if total>entry['capacity']:
+            capacity=max(MIN_CAPACITY,entry['capacity']*2,total)
+            current={c:np.array(self.array(key,c)[:rows]) for c in columns} if rows else None
+            self.allocate(key,columns,dtypes,capacity,current)
+            entry['capacity']=capacity
+
+        if rows==0 or added['date'][0]>last:
+            #the common case: a newer week goes at the end
+            for column in columns:
+                self.array(key,column)[rows:total]=added[column]
+        else:
+            #backfilled weeks: merge and rewrite the series in date order
+            order=np.argsort(np.concatenate([self.array(key,'date')[:rows],added['date']]),kind='stable')
+            for column in columns:
+                merged=np.concatenate([self.array(key,column)[:rows],added[column]])
+                self.array(key,column)[:total]=merged[order]
+        entry['rows']=total
+
+    def flush(self):
+        """Flush the arrays, then atomically publish the index"""
+        for array in self.arrays.values():
+            if isinstance(array,np.memmap) and array.mode!='r':
+                array.flush()
+        tmp=self.index_path+'.tmp'
+        with open(tmp,'w',encoding='utf-8') as f:
+            json.dump(self.index,f)
+        os.replace(tmp,self.index_path)
+
+    def series(self,code,column,start=None,end=None,report=cftc.LEGACY_FUTURES.report):
+        """Dates and values of one column between two dates, as array views"""
+        key,entry=self.entry(report,code)
+        rows=entry['rows']
+        dates=self.array(key,'date')[:rows]
+        lo=np.searchsorted(dates,np.datetime64(start,'D')) if start is not None else 0
+        hi=np.searchsorted(dates,np.datetime64(end,'D'),side='right') if end is not None else rows
+        return dates[lo:hi],self.array(key,column)[lo:hi]
+
+    def frame(self,code,columns,start=None,end=None,report=cftc.LEGACY_FUTURES.report):
+        """Several columns of one commodity as a date-indexed DataFrame"""
+        data={}
+        for column in columns:
+            dates,data[column]=self.series(code,column,start,end,report)
+        return pd.DataFrame(data,index=pd.DatetimeIndex(dates,name='date'))
+
+    def net_position(self,code,category='non_commercial',years=5,report=cftc.LEGACY_FUTURES.report):
+        """Long minus short commitments of a trader category over the last years"""
+        key,entry=self.entry(report,code)
+        last=self.array(key,'date')[entry['rows']-1]
+        start=last-np.timedelta64(365*years,'D')
+        dates,long=self.series(code,f'{category}_long_commitment',start,report=report)
+        _,short=self.series(code,f'{category}_short_commitment',start,report=report)
+        return pd.Series(long-short,index=pd.DatetimeIndex(dates,name='date'),name=code)
+
+    def close(self):
+        self.arrays.clear()
+
+
+def main():
+
+    parser=argparse.ArgumentParser(description='Store and query parsed COT reports')
+    parser.add_argument('--root',default=STORE_DIR)
+    parser.add_argument('--url',default='https://www.cftc.gov/dea/futures/deacmesf.htm',
+                        help='report page to append, one of cftc.PAGES')
+    parser.add_argument('--code',help='commodity code to query after appending')
+    parser.add_argument('--category',default='non_commercial',help='trader category of the net position')
+    parser.add_argument('--years',type=int,default=5)
+    args=parser.parse_args()
+
+    store=COTStore(args.root)
+    layout=cftc.PAGES.get(args.url,cftc.LEGACY_FUTURES)
+    store.append(cftc.fetch(args.url,layout=layout),layout.report)
+    print(f'{len(store.index)} series in {args.root}')
+
+    if args.code:
+        print(store.net_position(args.code,args.category,args.years,layout.report).to_string())
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import http.server
+import threading
+
+import pandas as pd
+import pytest
+
+import cftc
+import cftc_store
+
+
+#one block per report family, trimmed to the lines the grammar reads
+LEGACY_BLOCK=b'''WHEAT-SRW - CHICAGO BOARD OF TRADE                                   Code-001602
+FUTURES ONLY POSITIONS AS OF 09/17/24                                |
+-------------------------------------------------------------------------------
+   NON-COMMERCIAL         |   COMMERCIAL    |      TOTAL      |  NONREPORTABLE
+  LONG  | SHORT  |SPREADS |  LONG  | SHORT  |  LONG  | SHORT  |  LONG  | SHORT
+-------------------------------------------------------------------------------
+(CONTRACTS OF 5,000 BUSHELS)                      OPEN INTEREST:      359,027
+COMMITMENTS
+  85,979  124,456   95,120  146,893  113,123  327,992  332,699   31,035   26,328
+
+CHANGES FROM 09/10/24 (CHANGE IN OPEN INTEREST:      5,432)
+   1,234   -2,345    3,456    4,567   -1,234    9,257     -123     -823    5,555
+
+PERCENT OF OPEN INTEREST FOR EACH CATEGORY OF TRADERS
+    23.9     34.7     26.5     40.9     31.5     91.4     92.7      8.6      7.3
+
+NUMBER OF TRADERS IN EACH CATEGORY (TOTAL TRADERS:   345)
+     101      112      104       90       97      250      256
+'''
+
+DISAGGREGATED_BLOCK=b'''WHEAT-SRW - CHICAGO BOARD OF TRADE                                   Code-001602
+Disaggregated Commitments of Traders - Futures Only, September 17, 2024
+-------------------------------------------------------------------------------
+      :          :   Producer/Merchant  :   Swap Dealers   :  Managed Money   :  Other Reportables  : Nonreportable
+      : Interest :    Long  :   Short   : Long : Short :Spreading: Long : Short :Spreading: Long : Short :Spreading:  Long : Short
+-------------------------------------------------------------------------------
+      :          :(CONTRACTS OF 5,000 BUSHELS)
+      :          :  Positions
+All   :  452,316:  38,123  52,345  47,123  12,345   4,567 103,456 145,678  78,901  45,678  23,456  34,567  35,123  36,234
+Old   :  452,316:  38,123  52,345  47,123  12,345   4,567 103,456 145,678  78,901  45,678  23,456  34,567  35,123  36,234
+      :          :  Changes in Commitments from: September 10, 2024
+      :    5,432:   1,234  -2,345     345    -456      12   3,456  -1,234     789     -90     123    -456     678    -789
+      :          :  Percent of Open Interest Represented by Each Category of Trader
+All   :    100.0:     8.4    11.6    10.4     2.7     1.0    22.9    32.2    17.4    10.1     5.2     7.6     7.8     8.0
+      :          :  Number of Traders in Each Category
+All   :      345:      67      89      21      14      12      78      95      54      60      41      38
+'''
+
+TFF_BLOCK=b'''EURO FX - CHICAGO MERCANTILE EXCHANGE                                Code-099741
+Traders in Financial Futures - Futures Only Positions as of September 17, 2024
+-------------------------------------------------------------------------------
+      :        Dealer         :    Asset Manager     :   Leveraged Funds    :  Other Reportables   : Nonreportable
+      : Long  : Short :Spreading: Long : Short :Spreading: Long : Short :Spreading: Long : Short :Spreading: Long : Short
+-------------------------------------------------------------------------------
+      :          :(CONTRACTS OF EUR 125,000)
+      :          :  Positions
+All   :  652,310:  31,210 180,443   9,876 324,567  98,765  12,345  88,901 201,234  23,456  45,678  34,567   7,890  63,432  61,230
+      :          :  Changes in Commitments from: September 10, 2024
+      :   -4,321:   1,210  -3,443     876  -4,567   8,765    -345   2,901  -1,234     456    -678     567    -890   1,432    -230
+      :          :  Percent of Open Interest Represented by Each Category of Trader
+All   :    100.0:     4.8    27.7     1.5    49.8    15.1     1.9    13.6    30.8     3.6     7.0     5.3     1.2     9.7     9.4
+      :          :  Number of Traders in Each Category
+All   :      412:      24      31      18     112      67      29      81      92      44      55      38      27
+'''
+
+
+def test_legacy_row():
+    df=cftc.parse(LEGACY_BLOCK,cftc.LEGACY_FUTURES)
+    row=df.iloc[0]
+    assert len(df)==1
+    assert row['commodity_code']=='001602'
+    assert row['open_interest']==359027
+    assert row['non_commercial_spread_commitment']==95120
+    assert row['non_reportable_short_commitment']==26328
+    assert row['non_reportable_short_percent']==pytest.approx(7.3)
+    assert row['total_short_traders']==256
+
+
+def test_disaggregated_row():
+    df=cftc.parse(DISAGGREGATED_BLOCK,cftc.DISAGGREGATED_FUTURES)
+    row=df.iloc[0]
+    assert len(df)==1
+    assert row['date']==pd.Timestamp('2024-09-17')
+    assert row['contractunit']=='CONTRACTS OF 5,000 BUSHELS'
+    assert row['prod_merc_short_commitment']==52345
+    assert row['swap_spread_commitment']==4567
+    assert row['nonrept_short_commitment']==36234
+    assert row['other_rept_spread_change']==-456
+    assert row['m_money_long_percent']==pytest.approx(22.9)
+    assert row['other_rept_spread_traders']==38
+
+
+def test_tff_row():
+    df=cftc.parse(TFF_BLOCK,cftc.TFF_FUTURES)
+    row=df.iloc[0]
+    assert len(df)==1
+    assert row['open_interest']==652310
+    assert row['dealer_spread_commitment']==9876
+    assert row['asset_mgr_long_commitment']==324567
+    assert row['other_rept_spread_commitment']==7890
+    assert row['nonrept_short_commitment']==61230
+    assert row['dealer_spread_change']==876
+    assert row['nonrept_long_percent']==pytest.approx(9.7)
+    assert row['dealer_spread_traders']==18
+    assert row['other_rept_spread_traders']==27
+
+
+def test_row_with_wrong_column_count_raises():
+    #the TFF block read with the disaggregated layout has one number too many per row
+    with pytest.raises(ValueError,match='15 numbers for 14 columns'):
+        cftc.parse(TFF_BLOCK,cftc.DISAGGREGATED_FUTURES)
+
+
+#local stand-in for cftc.gov: one report page behind an ETag
+class ReportHandler(http.server.BaseHTTPRequestHandler):
+    etag='"v1"'
+    requests=[]
+
+    def do_GET(self):
+        ReportHandler.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match')==self.etag:
+            self.send_response(304)
+            self.send_header('ETag',self.etag)
+            self.end_headers()
+            return
+        body=b'<html><body><pre>\n'+LEGACY_BLOCK+b'</pre></body></html>'
+        self.send_response(200)
+        self.send_header('ETag',self.etag)
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,*args):
+        pass
+
+
+@pytest.fixture
+def report_url():
+    ReportHandler.requests=[]
+    server=http.server.ThreadingHTTPServer(('127.0.0.1',0),ReportHandler)
+    thread=threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/dea/futures/deacmesf.htm'
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_revalidates_with_etag(report_url,tmp_path,monkeypatch):
+    calls=[]
+    etl=cftc.etl
+
+    def counting_etl(response,layout):
+        calls.append(response.status_code)
+        return etl(response,layout)
+
+    monkeypatch.setattr(cftc,'etl',counting_etl)
+
+    first=cftc.fetch(report_url,cache_dir=str(tmp_path))
+    second=cftc.fetch(report_url,cache_dir=str(tmp_path))
+
+    assert 'If-None-Match' not in ReportHandler.requests[0]
+    assert ReportHandler.requests[1]['If-None-Match']=='"v1"'
+    #the 304 is served from the cached frame without parsing anything
+    assert calls==[200]
+    pd.testing.assert_frame_equal(first,second)
+    assert second['open_interest'].iloc[0]==359027
+
+
+def test_store_keeps_report_families_apart(tmp_path):
+    futures=cftc.parse(LEGACY_BLOCK,cftc.LEGACY_FUTURES)
+    combined=futures.assign(open_interest=futures['open_interest']+1000)
+    store=cftc_store.COTStore(str(tmp_path))
+    store.append(futures)
+    store.append(combined,cftc.LEGACY_COMBINED.report)
+
+    #same commodity and week, two series
+    _,futures_oi=store.series('001602','open_interest')
+    _,combined_oi=store.series('001602','open_interest',report='legacy_combined')
+    assert list(futures_oi)==[359027]
+    assert list(combined_oi)==[360027]
+    assert store.net_position('001602').iloc[0]==85979-124456
+
+    with pytest.raises(ValueError,match='does not match the legacy_futures layout'):
+        store.append(cftc.parse(DISAGGREGATED_BLOCK,cftc.DISAGGREGATED_FUTURES))
+    with pytest.raises(ValueError,match='holds the disaggregated_futures report, not legacy_futures'):
+        disaggregated=cftc.parse(DISAGGREGATED_BLOCK,cftc.DISAGGREGATED_FUTURES)
+        store.append(disaggregated.assign(report='disaggregated_futures'),'legacy_futures')
+    store.append(disaggregated.assign(report='disaggregated_futures'))
+    _,managed=store.series('001602','m_money_long_commitment',report='disaggregated_futures')
+    assert list(managed)==[103456]
+    assert sorted(store.index)==['disaggregated_futures/001602','legacy_combined/001602','legacy_futures/001602']
+    store.close()
@@ -0,0 +1,92 @@
+"""
+Adaptive pacing for the Maps scrapers, driven by throttling signals
+
+The hard-coded human_delay ranges are kept as the shape of the pauses,
+but every pause is multiplied by AdaptiveDelay.factor. The factor follows
+AIMD: it grows by a fixed step whenever Google shows trouble (unusual
+traffic page, consent or CAPTCHA interstitial, feed timeout, empty feed)
+and shrinks by a constant ratio after every healthy scroll, so the
+scrapers run close to flat out until Google starts pushing back.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MIN_FACTOR = 0.1
+MAX_FACTOR = 5.0
+INCREASE = 1.0       # added to the factor on every trouble signal
+DECREASE = 0.8       # factor multiplied by this after every healthy step
+BACKOFF_UNIT = 10.0  # seconds of extra pause per unit of factor above 1
+
+SIGNALS = ('unusual_traffic', 'consent', 'captcha', 'feed_timeout', 'empty_feed')
+
+# Classify the current page in one round trip: null when it looks normal.
+# Only the URL, title and a few selectors are read, so it is cheap enough
+# to run after every scroll that brought nothing.
+DETECT_BLOCK_JS = """
+const url = location.href;
+if (url.includes("/sorry/")) return "unusual_traffic";
+if (url.includes("consent.google.") || document.querySelector("form[action*='consent']")) return "consent";
+if (document.querySelector("iframe[src*='recaptcha'], #captcha-form, div.g-recaptcha")) return "captcha";
+if (/unusual traffic/i.test(document.title)) return "unusual_traffic";
+return null;
+"""
+
+
+def detect_block(driver):
+    """Name of the block signal the current page shows, or None"""
+    try:
+        return driver.execute_script(DETECT_BLOCK_JS)
+    except Exception as e:
+        logger.warning(f"Could not inspect page for block signals: {e}")
+        return None
+
+
+class AdaptiveDelay:
+    """Thread-safe AIMD multiplier for the scrapers' pauses"""
+
+    def __init__(self, min_factor=MIN_FACTOR, max_factor=MAX_FACTOR, increase=INCREASE,
+                 decrease=DECREASE, initial=1.0):
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.increase = increase
+        self.decrease = decrease
+        self.factor = initial
+        self.healthy_steps = 0
+        self.signals = {signal: 0 for signal in SIGNALS}
+        self.lock = threading.Lock()
+
+    def trouble(self, signal, context=""):
+        """Additive increase after a throttling signal"""
+        with self.lock:
+            self.signals[signal] = self.signals.get(signal, 0) + 1
+            previous = self.factor
+            self.factor = min(self.max_factor, self.factor + self.increase)
+        logger.warning(f"Throttling signal {signal}{f' ({context})' if context else ''}: "
+                       f"delay factor {previous:.2f} -> {self.factor:.2f}")
+
+    def healthy(self):
+        """Multiplicative decrease after a step that went through"""
+        with self.lock:
+            self.healthy_steps += 1
+            self.factor = max(self.min_factor, self.factor * self.decrease)
+
+    def scale(self, seconds):
+        """A pause of `seconds` at the current pace"""
+        return seconds * self.factor
+
+    def backoff(self):
+        """Extra pause while recovering from trouble, zero once the factor is back under 1"""
+        seconds = max(0.0, self.factor - 1.0) * BACKOFF_UNIT
+        if seconds:
+            logger.info(f"Backing off {seconds:.1f}s (delay factor {self.factor:.2f})")
+            time.sleep(seconds)
+        return seconds
+
+    def stats(self):
+        with self.lock:
+            return {'delay_factor': round(self.factor, 3), 'healthy_steps': self.healthy_steps,
+                    'signals': dict(self.signals)}
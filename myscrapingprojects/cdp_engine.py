@@ -0,0 +1,331 @@
+"""
+Multi-tab Maps search engine speaking the DevTools protocol directly
+
+One Chrome per thread caps a box at a handful of workers, mostly on
+memory. MultiTabEngine instead opens several tabs in every browser and
+drives all of them from one trio event loop over the browser's DevTools
+websocket (trio-websocket, already installed with selenium). Each tab
+lives in its own browser context, so searches don't share cookies, and
+pulls state searches from a shared queue until none are left.
+
+The browsers themselves are still launched by the scrapers' Selenium
+setup (proxy, user agent, stealth options); the engine only needs their
+debugger addresses. The page-side code is the same as the Selenium path:
+maps_feed.EXTRACT_CARDS_JS for the cards, maps_feed.SCROLL_AND_WAIT_JS
+for scrolling and adaptive_delay.DETECT_BLOCK_JS for block pages, so the
+cards feed the scrapers' place_from_card unchanged.
+"""
+
+import itertools
+import json
+import logging
+from collections import namedtuple
+from contextlib import asynccontextmanager
+
+import requests
+import trio
+from trio_websocket import ConnectionClosed, open_websocket_url
+
+from adaptive_delay import DETECT_BLOCK_JS
+from maps_feed import END_OF_LIST_SELECTOR, EXTRACT_CARDS_JS, FEED_WAIT_TIMEOUT, SCROLL_AND_WAIT_JS, SEEN_ATTRIBUTE
+
+logger = logging.getLogger(__name__)
+
+FEED_SELECTOR = "div[role='feed']"
+CARD_SELECTOR = "div.Nv2PK.tH5CWc.THOPZb"
+FEED_TIMEOUT = 25
+POLL_INTERVAL = 0.25
+MAX_MESSAGE_SIZE = 2 ** 24  # extracted card batches easily pass the 1 MiB default
+
+# One finished search: which browser and tab ran it, its cards, and the
+# block signal that cut it short if any
+SearchResult = namedtuple('SearchResult', ['key', 'browser', 'tab', 'cards', 'signal'])
+
+
+class CDPError(Exception):
+    pass
+
+
+def debugger_address(driver):
+    """host:port of the DevTools endpoint of a Selenium-launched Chrome"""
+    return driver.capabilities['goog:chromeOptions']['debuggerAddress']
+
+
+def browser_websocket_url(address):
+    """Browser-level DevTools websocket of a debugger address"""
+    response = requests.get(f"http://{address}/json/version", timeout=10)
+    response.raise_for_status()
+    return response.json()['webSocketDebuggerUrl']
+
+
+def function_call(body, args, feed=True):
+    """Expression calling a Selenium-style script body (`arguments`, `return`)
+
+    The feed element goes first when `feed` is set, like the WebElement
+    the Selenium path passes; the other arguments are JSON literals.
+    """
+    literals = [json.dumps(arg) for arg in args]
+    if feed:
+        literals.insert(0, f"document.querySelector({json.dumps(FEED_SELECTOR)})")
+    return f"(function() {{{body}}}).apply(null, [{', '.join(literals)}])"
+
+
+class CDPBrowser:
+    """One browser websocket; tabs are flattened target sessions on it"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.ids = itertools.count(1)
+        self.waiting = {}
+        self.responses = {}
+
+    async def read_messages(self):
+        """Route command responses to their callers until the socket closes"""
+        try:
+            while True:
+                message = json.loads(await self.ws.get_message())
+                if 'id' in message and message['id'] in self.waiting:
+                    self.responses[message['id']] = message
+                    self.waiting.pop(message['id']).set()
+        except ConnectionClosed:
+            for command_id, event in self.waiting.items():
+                self.responses[command_id] = {'error': {'message': 'DevTools connection closed'}}
+                event.set()
+            self.waiting.clear()
+
+    async def send(self, method, params=None, session_id=None):
+        command_id = next(self.ids)
+        message = {'id': command_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        event = trio.Event()
+        self.waiting[command_id] = event
+        await self.ws.send_message(json.dumps(message))
+        await event.wait()
+        response = self.responses.pop(command_id)
+        if 'error' in response:
+            raise CDPError(f"{method}: {response['error'].get('message')}")
+        return response.get('result', {})
+
+    async def new_tab(self, blocked_patterns=None):
+        """Open a tab in a fresh browser context and attach to it"""
+        context = await self.send('Target.createBrowserContext', {'disposeOnDetach': True})
+        target = await self.send('Target.createTarget', {
+            'url': 'about:blank', 'browserContextId': context['browserContextId'],
+        })
+        session = await self.send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+        tab = CDPTab(self, target['targetId'], session['sessionId'], context['browserContextId'])
+        # Tabs other than the focused one would otherwise stop rendering new cards
+        await tab.send('Emulation.setFocusEmulationEnabled', {'enabled': True})
+        if blocked_patterns:
+            await tab.send('Network.enable')
+            await tab.send('Network.setBlockedURLs', {'urls': blocked_patterns})
+        return tab
+
+
+class CDPTab:
+    """One attached tab: navigation and script calls"""
+
+    def __init__(self, browser, target_id, session_id, context_id):
+        self.browser = browser
+        self.target_id = target_id
+        self.session_id = session_id
+        self.context_id = context_id
+
+    async def send(self, method, params=None):
+        return await self.browser.send(method, params, self.session_id)
+
+    async def evaluate(self, expression, await_promise=False):
+        result = await self.send('Runtime.evaluate', {
+            'expression': expression, 'returnByValue': True, 'awaitPromise': await_promise,
+        })
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            raise CDPError(details.get('exception', {}).get('description') or details.get('text'))
+        return result['result'].get('value')
+
+    async def call(self, body, *args, feed=True):
+        """Run a Selenium-style script body, like driver.execute_script"""
+        return await self.evaluate(function_call(body, args, feed))
+
+    async def call_async(self, body, *args):
+        """Run a script that reports through its last argument, like execute_async_script"""
+        literals = [json.dumps(arg) for arg in args]
+        expression = (f"new Promise(done => (function() {{{body}}}).apply(null, ["
+                      f"document.querySelector({json.dumps(FEED_SELECTOR)}), {', '.join(literals)}, done]))")
+        return await self.evaluate(expression, await_promise=True)
+
+    async def navigate(self, url):
+        await self.send('Page.navigate', {'url': url})
+
+    async def wait_for(self, selector, timeout=FEED_TIMEOUT):
+        """Poll until selector matches, False on timeout"""
+        with trio.move_on_after(timeout):
+            while True:
+                try:
+                    if await self.evaluate(f"!!document.querySelector({json.dumps(selector)})"):
+                        return True
+                except CDPError:
+                    pass  # the page is still swapping execution contexts mid-navigation
+                await trio.sleep(POLL_INTERVAL)
+        return False
+
+    async def close(self):
+        try:
+            await self.browser.send('Target.closeTarget', {'targetId': self.target_id})
+            await self.browser.send('Target.disposeBrowserContext', {'browserContextId': self.context_id})
+        except CDPError as e:
+            logger.warning(f"Could not close tab {self.target_id}: {e}")
+
+
+@asynccontextmanager
+async def connect(address):
+    """Browser connection with its message reader running"""
+    url = await trio.to_thread.run_sync(browser_websocket_url, address)
+    async with open_websocket_url(url, max_message_size=MAX_MESSAGE_SIZE) as ws:
+        browser = CDPBrowser(ws)
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(browser.read_messages)
+            try:
+                yield browser
+            finally:
+                nursery.cancel_scope.cancel()
+
+
+class MultiTabEngine:
+    """Runs Maps searches in `tabs_per_browser` tabs of every browser at once
+
+    pace(browser) is a blocking callable run in a worker thread before every
+    navigation and scroll (the scrapers' rate limiter and backoff);
+    on_signal(signal, key) and on_healthy() feed the delay controller.
+    on_result(result) is a blocking callable run in a worker thread with
+    the SearchResult of each search as soon as it finishes; it returns how
+    many of the cards were kept, which is what the budget is charged.
+    """
+
+    def __init__(self, addresses, tabs_per_browser=4, card_selector=CARD_SELECTOR, blocked_patterns=None,
+                 pace=None, on_signal=None, on_healthy=None, on_result=None):
+        self.addresses = addresses
+        self.tabs_per_browser = tabs_per_browser
+        self.card_selector = card_selector
+        self.blocked_patterns = blocked_patterns
+        self.pace = pace
+        self.on_signal = on_signal
+        self.on_healthy = on_healthy
+        self.on_result = on_result
+
+    def run(self, searches, budget):
+        """searches: (key, url) pairs, each granted its quota of a scheduler.ResultBudget
+        as it starts. Returns the SearchResult of every search that ran."""
+        return trio.run(self.run_all, searches, budget)
+
+    async def run_all(self, searches, budget):
+        results = []
+        send, receive = trio.open_memory_channel(len(searches))
+        for search in searches:
+            send.send_nowait(search)
+        send.close()
+
+        async with trio.open_nursery() as nursery:
+            for browser_index, address in enumerate(self.addresses):
+                nursery.start_soon(self.run_browser, browser_index, address, receive.clone(), budget, results)
+        receive.close()
+        return results
+
+    async def run_browser(self, browser_index, address, searches, budget, results):
+        # A browser that fails leaves its searches in the queue for the others
+        try:
+            async with connect(address) as browser, searches:
+                async with trio.open_nursery() as nursery:
+                    for tab_index in range(self.tabs_per_browser):
+                        nursery.start_soon(self.run_tab, browser, browser_index, tab_index, searches.clone(),
+                                           budget, results)
+        except (OSError, ConnectionClosed, requests.RequestException) as e:
+            logger.error(f"Browser {browser_index} at {address} failed: {e}")
+
+    async def run_tab(self, browser, browser_index, tab_index, searches, budget, results):
+        label = f"{browser_index}.{tab_index}"
+        try:
+            tab = await browser.new_tab(self.blocked_patterns)
+        except CDPError as e:
+            logger.error(f"Tab {label} could not be opened: {e}")
+            await searches.aclose()
+            return
+        try:
+            async with searches:
+                async for key, url in searches:
+                    # Once the target is met the searches still queued are dropped
+                    if budget.exhausted:
+                        break
+                    quota = budget.reserve(searches.statistics().current_buffer_used + 1)
+                    logger.info(f"Tab {label} searching: {key}")
+                    try:
+                        cards, signal = await self.search(tab, browser_index, key, url, quota, budget)
+                    except CDPError as e:
+                        logger.error(f"Tab {label} ({key}) error: {e}")
+                        cards, signal = [], None
+                    logger.info(f"Tab {label} ({key}): {len(cards)} cards")
+                    result = SearchResult(key, browser_index, tab_index, cards, signal)
+                    results.append(result)
+                    used = len(cards)
+                    if self.on_result:
+                        used = await trio.to_thread.run_sync(self.on_result, result)
+                    budget.settle(quota, used)
+        finally:
+            with trio.CancelScope(shield=True):
+                await tab.close()
+
+    async def wait_turn(self, browser_index):
+        if self.pace:
+            await trio.to_thread.run_sync(self.pace, browser_index)
+
+    def report(self, signal, key):
+        if self.on_signal:
+            self.on_signal(signal, key)
+
+    async def search(self, tab, browser_index, key, url, max_results, budget):
+        """Scroll one search to its end, to max_results or until the budget runs out;
+        returns (cards, block signal)"""
+        await self.wait_turn(browser_index)
+        await tab.navigate(url)
+        if not await tab.wait_for(FEED_SELECTOR):
+            signal = await tab.call(DETECT_BLOCK_JS, feed=False) or "feed_timeout"
+            self.report(signal, key)
+            return [], signal
+
+        cards = []
+        no_new_results_count = 0
+        scroll_count = 0
+        end_of_list = False
+        while len(cards) < max_results and not budget.exhausted:
+            payload = await tab.call(EXTRACT_CARDS_JS, self.card_selector, SEEN_ATTRIBUTE)
+            new_cards = json.loads(payload) if payload else []
+            # Once per search, like the Selenium path: the feed was empty before any scroll
+            if scroll_count == 0 and not new_cards:
+                self.report("empty_feed", key)
+            cards.extend(new_cards)
+
+            if end_of_list:
+                break
+            if not new_cards:
+                no_new_results_count += 1
+                if no_new_results_count >= 3:
+                    break
+            else:
+                no_new_results_count = 0
+
+            await self.wait_turn(browser_index)
+            scroll_count += 1
+            state = await tab.call_async(SCROLL_AND_WAIT_JS, self.card_selector, None, END_OF_LIST_SELECTOR,
+                                         int(FEED_WAIT_TIMEOUT * 1000))
+            end_of_list = state['end']
+            if state['count'] > state['previous']:
+                if self.on_healthy:
+                    self.on_healthy()
+            elif not end_of_list:
+                signal = await tab.call(DETECT_BLOCK_JS, feed=False)
+                if signal:
+                    self.report(signal, key)
+                    return cards[:max_results], signal
+
+        return cards[:max_results], None
@@ -0,0 +1,107 @@
+"""
+Bounded pool of warm Chrome drivers for the multithreaded Maps scrapers
+
+Launching Chrome, testing the proxy and sleeping through the staggered
+startup delay costs more than scraping a small state, so every worker
+slot keeps one browser and leases it to one state task after another.
+Cookies and storage are wiped between tasks; the browser itself is only
+replaced after max_tasks tasks or when a task fails.
+"""
+
+import logging
+import queue
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TASKS = 10
+STORAGE_TYPES = "cookies,local_storage,session_storage,indexeddb,websql,service_workers,cache_storage"
+
+
+def reset_session(driver):
+    """Forget the previous task's cookies and site storage, keep the HTTP cache"""
+    parts = urlsplit(driver.current_url)
+    if parts.scheme in ("http", "https"):
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+            "origin": f"{parts.scheme}://{parts.netloc}",
+            "storageTypes": STORAGE_TYPES,
+        })
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.get("about:blank")
+
+
+class PooledDriver:
+    """One slot of the pool: the worker identity and its current browser
+
+    slot doubles as the scrapers' thread_id (user agent, window size,
+    proxy session); session_id is whatever the driver factory records.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.driver = None
+        self.session_id = None
+        self.tasks = 0
+        self.failed = False
+
+
+class DriverPool:
+    """At most `size` browsers, each leased to one task at a time
+
+    create_driver(lease) launches the browser of a slot and may set
+    lease.session_id. Browsers start lazily on their slot's first lease.
+    """
+
+    def __init__(self, create_driver, size, max_tasks=DEFAULT_MAX_TASKS):
+        self.create_driver = create_driver
+        self.max_tasks = max_tasks
+        self.slots = [PooledDriver(slot) for slot in range(size)]
+        self.idle = queue.Queue()
+        for lease in self.slots:
+            self.idle.put(lease)
+
+    def acquire(self):
+        """Block until a slot is free and return it with a live driver"""
+        lease = self.idle.get()
+        if lease.driver is None:
+            try:
+                lease.driver = self.create_driver(lease)
+            except Exception:
+                self.idle.put(lease)
+                raise
+            lease.tasks = 0
+        lease.failed = False
+        return lease
+
+    def release(self, lease):
+        """Hand a slot back; set lease.failed first to replace its browser"""
+        if lease.driver is not None:
+            lease.tasks += 1
+            if lease.failed:
+                logger.info(f"Slot {lease.slot}: recycling driver after a failed task")
+                self.recycle(lease)
+            elif lease.tasks >= self.max_tasks:
+                logger.info(f"Slot {lease.slot}: recycling driver after {lease.tasks} tasks")
+                self.recycle(lease)
+            else:
+                try:
+                    reset_session(lease.driver)
+                except Exception as e:
+                    logger.warning(f"Slot {lease.slot}: session reset failed, recycling driver: {e}")
+                    self.recycle(lease)
+        self.idle.put(lease)
+
+    def recycle(self, lease):
+        """Quit the slot's browser, its next lease launches a fresh one"""
+        try:
+            lease.driver.quit()
+        except Exception as e:
+            logger.error(f"Error closing driver for slot {lease.slot}: {e}")
+        lease.driver = None
+        lease.session_id = None
+
+    def close(self):
+        """Quit every idle browser; the pool can still be leased from afterwards"""
+        for lease in self.slots:
+            if lease.driver is not None:
+                self.recycle(lease)
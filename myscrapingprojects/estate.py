@@ -8,8 +8,9 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import time
-import pandas as pd
+from maps_feed import CardStream, scroll_and_wait
+from maps_xhr import SearchCapture, enable_capture
+from result_sink import PLACE_FIELDS, ResultSink
 
 
 # setting the logger
@@ -19,9 +20,15 @@ logger = logging.getLogger(__name__)
 
 
 class EstateScraper:
-  def __init__(self, headless=True):
-    """Initializing the driver to none just to use it later"""
+  def __init__(self, headless=True, extraction_mode="batch"):
+    """Initializing the driver to none just to use it later
+
+    extraction_mode: "batch" reads every new card in one execute_script call,
+    "xhr" decodes the search XHRs Maps fires while scrolling,
+    "element" queries each field of each card through its WebElement
+    """
     self.driver = None
+    self.extraction_mode = extraction_mode
     self.setup_driver(headless)
 
   def setup_driver(self, headless):
@@ -34,6 +41,8 @@ class EstateScraper:
     chrome_options.add_argument("--disable-blink-features=AutomationControlled")
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
+    if self.extraction_mode == "xhr":
+      enable_capture(chrome_options)
 
     """Creaing the driver from webdriver"""
     try:
@@ -77,13 +86,34 @@ class EstateScraper:
     return data
 
 
+  def place_from_card(self, card):
+    """building the same record as extract_place_data from batch-extracted card fields"""
+    return {
+      'name': card.get('name'),
+      'rating': card.get('rating'),
+      'address': card.get('address'),
+      # place id, cid, coordinates... when the card came from a search XHR
+      **(card.get('extra') or {}),
+    }
+
 
 
 
 
 
 
-  def search_places(self, query, location, max_results=10):
+
+  def search_places(self, query, location, max_results=10, output=None):
+    """searching and, with output (.csv, .jsonl or .parquet), writing each place as it is found"""
+    sink = ResultSink(output, PLACE_FIELDS) if output else None
+    try:
+      return self.scrape_places(query, location, max_results, sink)
+    finally:
+      if sink:
+        sink.close()
+
+
+  def scrape_places(self, query, location, max_results, sink=None):
     """let's build the url to search for places"""
     search_query = f"{query} {location}".replace(" ", "+")
     url = f"https://www.google.co.in/maps/search/{search_query}"
@@ -112,27 +142,37 @@ class EstateScraper:
     except NoSuchElementException:
       logger.error("Could not find the results container")
       return places
+
+    # start listening for the search XHRs before the first scroll
+    capture = SearchCapture(self.driver) if self.extraction_mode == "xhr" else None
+    cards = CardStream(self.driver, results_panel, "div.Nv2PK.tH5CWc.THOPZb", self.extraction_mode, capture)
     
 
     previous_count = 0
     no_new_results_count = 0
+    end_of_list = False
     
     while len(places) < max_results:
-      # getting the current places elements
-      place_elements = results_panel.find_elements(By.CSS_SELECTOR, "div.Nv2PK.tH5CWc.THOPZb ")
+      # only the cards rendered since the last pass
+      place_elements = cards.next_cards()
 
-      for place_element in place_elements[len(places):]:
+      for place_element in place_elements:
         # only process new elements
         if len(places) >= max_results:
           break
 
         try:
-          place_data = self.extract_place_data(place_element)
+          if self.extraction_mode in ("batch", "xhr"):
+            place_data = self.place_from_card(place_element)
+          else:
+            place_data = self.extract_place_data(place_element)
 
           # Avoid duplicates
           place_id = f"{place_data.get('name', '')}_{place_data.get('address', '')}"
           if place_id not in seen_places and place_data.get('name'):
             places.append(place_data)
+            if sink:
+              sink.write(place_data)
             seen_places.add(place_id)
             logger.info(f"Scraped: {place_data.get('name', 'Unknown')}")
 
@@ -140,6 +180,11 @@ class EstateScraper:
           logger.error(f"Error extracting place data: {e}")
           continue
 
+      # Maps showed its end-of-list marker and the last cards are processed
+      if end_of_list:
+          logger.info("Reached the end of the results list")
+          break
+
       # Check if we found new results
       if len(places) == previous_count:
           no_new_results_count += 1
@@ -151,23 +196,14 @@ class EstateScraper:
 
       previous_count = len(places)
             
-      # Scroll down to load more results
-      self.driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight", results_panel)
-      time.sleep(3)  # Longer wait for content to load
+      # Scroll down and wait only until more results render or the list ends
+      _, _, end_of_list = scroll_and_wait(self.driver, results_panel, "div.Nv2PK.tH5CWc.THOPZb")
       
       logger.info(f"Currently scraped {len(places)} places")
 
     return places[:max_results]
 
 
-  def save_to_csv(self, places, filename):
-     """save data to csv using pandas"""
-     df = pd.DataFrame(places)
-     df.to_csv(filename, index=False)
-     logger.info(f"Data saved to {filename}")
-
-
-
   def close(self):
     """Close the browser driver"""
     if self.driver:
@@ -189,17 +225,14 @@ def main():
     places = scraper.search_places(
       query="estate planning firm",
       location = "usa",
-      max_results=10000
+      max_results=10000,
+      output="estate_planning_firms_usa.csv"  # written as the places are found
     )
 
     # print results
     for idx, place in enumerate(places, start=1):
       print(f"{idx}. {place['name']} - {place['address']} - Rating: {place['rating']}")
 
-
-    # Finally let's save to csv
-    scraper.save_to_csv(places, "estate_planning_firms_usa.csv")
-
   except Exception as e:
     logger.error(f"Error occurred during scraping: {e}")
 
@@ -6,13 +6,26 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import time
-import pandas as pd
 import random
 import threading
-import concurrent.futures
+import os
 from threading import Lock
 import requests
 import json
+import argparse
+from maps_feed import CardStream, scroll_and_wait
+from maps_xhr import SearchCapture, enable_capture
+from driver_pool import DriverPool, DEFAULT_MAX_TASKS
+from rate_limit import RateLimiter
+from adaptive_delay import AdaptiveDelay, detect_block
+from cdp_engine import MultiTabEngine, debugger_address
+from sharding import run_sharded
+from place_index import PlaceIndex, SeenSet, element_key, place_key
+from geo_tiles import INITIAL_CELL_DEGREES, RESULT_CAP, TilePlanner, place_state
+from scheduler import ResultBudget, Scheduler, TaskQueue
+from checkpoint import CheckpointStore
+from result_sink import ESTATE_FIELDS, ResultSink
+from resource_blocking import BlockingReport, block_resources, blocked_url_patterns
 
 
 # Setting the logger
@@ -22,17 +35,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SAMPLE_SIZE = 5
+
 
 class ProxyMultithreadedEstateScraper:
-    def __init__(self, max_workers=5, headless=True):
+    def __init__(self, max_workers=5, headless=True, extraction_mode="batch", max_tasks_per_driver=DEFAULT_MAX_TASKS,
+                 block_resources=True, rate_limiter=None, checkpoint_path=None, resume=False, output=None,
+                 index_dir=None):
         """
         Initialize scraper with proxy support and multithreading
         """
         self.max_workers = max_workers
         self.headless = headless
+        self.max_tasks_per_driver = max_tasks_per_driver
+        self.block_resources = block_resources
+        # "batch": one execute_script call per scroll for all new cards
+        # "xhr": decode the search XHRs Maps fires while the feed scrolls
+        # "element": one WebDriver round trip per field of every card
+        self.extraction_mode = extraction_mode
         self.results_lock = Lock()
-        self.all_results = []
-        self.seen_places = set()
+        # Set once the overall result target is met; running searches stop scrolling
+        self.stop_event = threading.Event()
+        # Only counts stay in memory; the records themselves go to the sink
+        self.results_count = 0
+        # The first few places, for main() to show
+        self.samples = []
+        # Canonical place ids; with index_dir they persist across runs and processes
+        self.index_dir = index_dir
+        self.seen_places = PlaceIndex(index_dir) if index_dir else SeenSet()
+        # Map tiles, photos and fonts never reach the metered proxy
+        self.blocked_patterns = blocked_url_patterns() if block_resources else None
+        self.traffic_reports = []
+        # Shared by all workers: paces navigations and scrolls per proxy session and overall
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Scales the pauses: up on block/CAPTCHA signals, down while healthy
+        self.delay_controller = AdaptiveDelay()
+        # One warm browser per worker, leased to one state after another
+        self.driver_pool = DriverPool(self.create_pooled_driver, max_workers, max_tasks_per_driver)
+        # New places stream to the output file as they are found (.csv, .jsonl or .parquet)
+        self.sink = ResultSink(output, ESTATE_FIELDS) if output else None
+        # Places, finished searches and scroll progress, on disk as the run goes
+        # Without resume the checkpoint starts empty, so a new run searches everything again
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.checkpoint = CheckpointStore(checkpoint_path, fresh=not resume) if checkpoint_path else None
+        if self.checkpoint and resume:
+            self.resume_from_checkpoint()
         
         # DataImpulse Proxy Configuration
         self.proxy_config = {
@@ -55,6 +103,33 @@ class ProxyMultithreadedEstateScraper:
             'West Virginia', 'Wisconsin', 'Wyoming'
         ]
 
+    def resume_from_checkpoint(self):
+        """Seed the output, the counts and the dedup set with what the checkpoint holds"""
+        # A persistent index already holds these ids, so add() is not asked whether they are new
+        for place_id, place_data in self.checkpoint.places():
+            self.seen_places.add(place_id)
+            if self.sink:
+                self.sink.write(place_data)
+            self.count_results([place_data])
+        finished = self.checkpoint.finished_searches()
+        interrupted = self.checkpoint.interrupted()
+        logger.info(f"Resuming from {self.checkpoint_path}: {self.results_count} places, "
+                    f"{len(finished)} finished searches, {len(interrupted)} interrupted")
+        for search, (scrolls, cards) in interrupted.items():
+            logger.info(f"  {search} was cut off after {scrolls} scrolls ({cards} cards) and starts over")
+
+    def count_results(self, results):
+        """Count newly found places, already written out, and return the running total"""
+        with self.results_lock:
+            self.results_count += len(results)
+            if len(self.samples) < SAMPLE_SIZE:
+                self.samples.extend(results[:SAMPLE_SIZE - len(self.samples)])
+            return self.results_count
+
+    def finished_searches(self):
+        """{search: cards Maps listed} of the searches a resumed run skips"""
+        return self.checkpoint.finished_searches() if self.checkpoint and self.resume else {}
+
     def test_proxy_connection(self, proxy_url):
         """Test if proxy is working before using it"""
         try:
@@ -153,9 +228,22 @@ class ProxyMultithreadedEstateScraper:
         chrome_options.add_argument("--disable-web-security")
         chrome_options.add_argument("--allow-running-insecure-content")
         
+        # Keep background tabs rendering for the multi-tab engine
+        chrome_options.add_argument("--disable-background-timer-throttling")
+        chrome_options.add_argument("--disable-backgrounding-occluded-windows")
+        chrome_options.add_argument("--disable-renderer-backgrounding")
+        
+        # Both the XHR capture and the traffic report read the performance log
+        if self.extraction_mode == "xhr" or self.blocked_patterns:
+            enable_capture(chrome_options)
+        
         try:
             driver = webdriver.Chrome(options=chrome_options)
             
+            # Drop tiles, photos and fonts before they go through the proxy
+            if self.blocked_patterns:
+                block_resources(driver, self.blocked_patterns)
+            
             # If using proxy with authentication, set up authentication
             if proxy_url and '@' in proxy_url:
                 auth_part = proxy_url.split('@')[0].replace('http://', '')
@@ -173,20 +261,22 @@ class ProxyMultithreadedEstateScraper:
             driver.execute_script("delete window.cdc_adoQpoasnfa76pfcZLmcfl_Promise;")
             driver.execute_script("delete window.cdc_adoQpoasnfa76pfcZLmcfl_Symbol;")
             
-            # Thread-specific startup delay
-            time.sleep(random.uniform(thread_id * 2, thread_id * 2 + 4))
-            
             return driver
             
         except Exception as e:
             logger.error(f"Thread {thread_id}: Error creating driver with proxy: {e}")
             raise
 
+    def create_pooled_driver(self, lease):
+        """Launch the browser of a pool slot, sticky to one proxy IP while it lives"""
+        lease.session_id = f"worker-{lease.slot}-{int(time.time())}"
+        return self.create_driver_with_proxy(lease.slot, session_id=lease.session_id)
+
     def human_delay(self, min_seconds=1, max_seconds=3, thread_factor=1):
         """Add random delay with thread-specific variation"""
         base_delay = random.uniform(min_seconds, max_seconds)
         thread_variation = random.uniform(0, thread_factor * 0.5)
-        time.sleep(base_delay + thread_variation)
+        time.sleep(self.delay_controller.scale(base_delay + thread_variation))
 
     def extract_place_data(self, place_element, thread_id):
         """Extract data from single place element (thread-safe)"""
@@ -194,7 +284,7 @@ class ProxyMultithreadedEstateScraper:
 
         def safe_extract(selector, attribute=None, container=place_element):
             try:
-                time.sleep(random.uniform(0.05, 0.2))  # Reduced delay for speed
+                time.sleep(self.delay_controller.scale(random.uniform(0.05, 0.2)))  # Reduced delay for speed
                 elem = container.find_element(By.CSS_SELECTOR, selector)
                 return elem.get_attribute(attribute) if attribute else elem.text.strip()
             except NoSuchElementException:
@@ -209,199 +299,482 @@ class ProxyMultithreadedEstateScraper:
         
         return data
 
-    def scrape_state(self, query, state, max_results_per_state, thread_id):
+    def place_from_card(self, card, thread_id):
+        """Build the same record as extract_place_data from batch-extracted card fields"""
+        return {
+            'name': card.get('name'),
+            'rating': card.get('rating'),
+            'address': card.get('address'),
+            'thread_id': thread_id,
+            'scraped_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+            # Place id, CID, coordinates... when the card came from a search XHR
+            **(card.get('extra') or {}),
+        }
+
+    def scrape_state(self, query, state, max_results_per_state):
         """Scrape estate planning firms in a specific state"""
-        logger.info(f"Thread {thread_id} starting to scrape {state}")
-        
-        driver = None
+        search_query = f"{query} {state} USA".replace(" ", "+")
+        url = f"https://www.google.co.in/maps/search/{search_query}"
+        state_results, _ = self.scrape_search(state, state, url, max_results_per_state)
+        return state_results
+
+    def scrape_tile(self, query, tile, max_results_per_tile=RESULT_CAP):
+        """Search one viewport cell of a state; returns (results, cards Maps listed)"""
+        return self.scrape_search(tile.state, tile.label, tile.url(query), max_results_per_tile, tiled=True)
+
+    def scrape_search(self, state, label, url, max_results_per_state, tiled=False):
+        """Scroll one Maps search of a state; returns (new results, cards Maps listed)
+
+        Places of a tiled search take the state of their address, since cells
+        overlap state borders; state_source records where the state came from
+        """
+        lease = None
         local_results = []
+        cards_seen = 0
         
         try:
-            # Create driver with proxy for this thread
-            driver = self.create_driver_with_proxy(thread_id, session_id=f"state-{state}")
-            
-            # Build search query
-            search_query = f"{query} {state} USA".replace(" ", "+")
-            url = f"https://www.google.co.in/maps/search/{search_query}"
+            # Lease a warm driver; its pool slot is this task's thread id
+            lease = self.driver_pool.acquire()
+            driver = lease.driver
+            thread_id = lease.slot
+            logger.info(f"Thread {thread_id} searching: {label}")
             
-            logger.info(f"Thread {thread_id} searching: {search_query}")
-            
-            # Human-like delay before navigation
-            self.human_delay(2, 5, thread_id)
+            # Wait for the shared request budget before navigating
+            self.delay_controller.backoff()
+            self.rate_limiter.acquire(lease.session_id)
             
+            # Transferred and blocked traffic of this search's page
+            report = BlockingReport() if self.blocked_patterns else None
+            if report:
+                driver.get_log("performance")  # leftovers of the previous task
+
             driver.get(url)
-            self.human_delay(4, 7, thread_id)
+
+            signal = detect_block(driver)
+            if signal:
+                self.delay_controller.trouble(signal, label)
+                lease.failed = True
+                return [], cards_seen
 
             # Wait for results to load
             try:
                 wait = WebDriverWait(driver, 25)
                 wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div[role='feed']")))
-                self.human_delay(2, 4, thread_id)
                 
             except TimeoutException:
-                logger.error(f"Thread {thread_id}: Timeout waiting for {state} results")
-                return []
+                logger.error(f"Thread {thread_id}: Timeout waiting for {label} results")
+                self.delay_controller.trouble(detect_block(driver) or "feed_timeout", label)
+                lease.failed = True
+                return [], cards_seen
 
             # Find results container
             try:
                 results_panel = driver.find_element(By.CSS_SELECTOR, "div[role='feed']")
-                self.human_delay(1, 2, thread_id)
                 
             except NoSuchElementException:
-                logger.error(f"Thread {thread_id}: Could not find results for {state}")
-                return []
+                logger.error(f"Thread {thread_id}: Could not find results for {label}")
+                return [], cards_seen
+
+            # Start listening for the search XHRs before the first scroll
+            capture = SearchCapture(driver, report.observe if report else None) if self.extraction_mode == "xhr" else None
+            cards = CardStream(driver, results_panel, "div.Nv2PK.tH5CWc.THOPZb", self.extraction_mode, capture)
 
             # Scraping loop
             previous_count = 0
             no_new_results_count = 0
             scroll_count = 0
+            end_of_list = False
             
-            while len(local_results) < max_results_per_state:
-                place_elements = results_panel.find_elements(By.CSS_SELECTOR, "div.Nv2PK.tH5CWc.THOPZb")
+            while len(local_results) < max_results_per_state and not self.stop_event.is_set():
+                place_elements = cards.next_cards()
+                if scroll_count == 0 and not place_elements:
+                    self.delay_controller.trouble("empty_feed", label)
 
                 # Process new elements
-                for place_element in place_elements[len(local_results):]:
+                for place_element in place_elements:
                     if len(local_results) >= max_results_per_state:
                         break
 
                     try:
-                        self.human_delay(0.3, 1, thread_id)
-                        place_data = self.extract_place_data(place_element, thread_id)
+                        # Canonical id before extraction: places already indexed cost nothing more
+                        if self.extraction_mode in ("batch", "xhr"):
+                            place_id = place_key(place_element)
+                        else:
+                            place_id = element_key(place_element)
+                        if place_id and place_id in self.seen_places:
+                            cards_seen += 1
+                            continue
+
+                        if self.extraction_mode in ("batch", "xhr"):
+                            # Nothing is read from the browser per card, so no per-card delay
+                            place_data = self.place_from_card(place_element, thread_id)
+                        else:
+                            self.human_delay(0.3, 1, thread_id)
+                            place_data = self.extract_place_data(place_element, thread_id)
                         place_data['state'] = state  # Add state info
+                        place_data['state_source'] = 'search'
+                        if tiled:
+                            place_data['state'], place_data['state_source'] = place_state(place_data.get('address'), state)
 
                         if place_data.get('name'):
-                            place_id = f"{place_data.get('name', '')}_{place_data.get('address', '')}_{state}"
+                            cards_seen += 1
+                            # Cards without a place link fall back to the normalized name and address
+                            place_id = place_id or place_key(place_data)
+                            place_data['place_key'] = place_id
                             
-                            # Thread-safe duplicate checking
-                            with self.results_lock:
-                                if place_id not in self.seen_places:
-                                    local_results.append(place_data)
-                                    self.seen_places.add(place_id)
-                                    logger.info(f"Thread {thread_id} ({state}): {place_data.get('name', 'Unknown')}")
+                            # Thread-safe (and, sharded, process-safe) duplicate checking
+                            if self.seen_places.add(place_id):
+                                local_results.append(place_data)
+                                if self.sink:
+                                    self.sink.write(place_data)
+                                if self.checkpoint:
+                                    self.checkpoint.add_place(place_id, label, place_data)
+                                logger.info(f"Thread {thread_id} ({label}): {place_data.get('name', 'Unknown')}")
 
                     except Exception as e:
                         logger.error(f"Thread {thread_id} extraction error: {e}")
                         continue
 
-                # Check for new results
-                if len(local_results) == previous_count:
+                # Maps showed its end-of-list marker and the last cards are processed
+                if end_of_list:
+                    logger.info(f"Thread {thread_id}: Reached the end of the results for {label}")
+                    break
+
+                # Check for new cards (duplicates of overlapping searches count)
+                if cards_seen == previous_count:
                     no_new_results_count += 1
                     if no_new_results_count >= 3:
-                        logger.info(f"Thread {thread_id}: No more results for {state}")
+                        logger.info(f"Thread {thread_id}: No more results for {label}")
                         break
-                    self.human_delay(4, 8, thread_id)
                 else:
                     no_new_results_count = 0
 
-                previous_count = len(local_results)
+                previous_count = cards_seen
                 scroll_count += 1
 
                 # Scroll with variation
                 scroll_amount = random.randint(600, 1000)
-                driver.execute_script(f"arguments[0].scrollTop += {scroll_amount}", results_panel)
-
-                # Variable delays
-                if scroll_count % 8 == 0:
-                    self.human_delay(8, 12, thread_id)
-                elif scroll_count % 4 == 0:
-                    self.human_delay(4, 6, thread_id)
+                self.delay_controller.backoff()
+                self.rate_limiter.acquire(lease.session_id)
+                # Returns as soon as the new results render, no fixed wait for them
+                _, grew, end_of_list = scroll_and_wait(driver, results_panel, "div.Nv2PK.tH5CWc.THOPZb", scroll_amount)
+                if grew:
+                    self.delay_controller.healthy()
+                elif not end_of_list:
+                    signal = detect_block(driver)
+                    if signal:
+                        self.delay_controller.trouble(signal, label)
+
+                logger.info(f"Thread {thread_id} ({label}): {len(local_results)} places (Scroll #{scroll_count}, "
+                            f"delay factor {self.delay_controller.factor:.2f})")
+                if self.checkpoint:
+                    self.checkpoint.save_progress(label, scroll_count, cards_seen)
+
+            if report:
+                # The capture reads the log in xhr mode, otherwise read it here
+                if capture:
+                    capture.read_log()
                 else:
-                    self.human_delay(2, 4, thread_id)
+                    report.collect(driver)
+                logger.info(f"Thread {thread_id} ({label}) traffic: {report.summary()}")
+                with self.results_lock:
+                    self.traffic_reports.append({'state': state, 'search': label, **report.as_dict()})
 
-                logger.info(f"Thread {thread_id} ({state}): {len(local_results)} places (Scroll #{scroll_count})")
+            # A search cut short by the result budget is not done, a resumed run redoes it
+            if self.checkpoint and not self.stop_event.is_set():
+                self.checkpoint.finish_search(label, len(local_results), cards_seen)
 
-            return local_results
+            return local_results, cards_seen
 
         except Exception as e:
-            logger.error(f"Thread {thread_id} ({state}) error: {e}")
-            return []
+            logger.error(f"Scraping {label} failed: {e}")
+            if lease:
+                lease.failed = True
+            return [], cards_seen
             
         finally:
-            if driver:
-                try:
-                    driver.quit()
-                except Exception as e:
-                    logger.error(f"Error closing driver for thread {thread_id}: {e}")
+            if lease:
+                self.driver_pool.release(lease)
 
-    def scrape_estate_firms_parallel(self, query="estate planning firm", max_results=5000):
+    def scrape_estate_firms_parallel(self, query="estate planning firm", max_results=5000, states=None,
+                                     on_results=None, budget=None):
         """
         Main method to scrape estate planning firms across US states in parallel
+
+        states overrides the default state selection; on_results(state, results)
+        is called as each state finishes; budget is a ResultBudget shared with
+        other scrapers (the sharded processes) instead of one of max_results.
+        Returns the number of places found; their records are in the output file
         """
         
-        # Distribute states across threads
-        states_to_scrape = self.us_states[:self.max_workers * 2]  # Limit states for testing
-        max_results_per_state = max_results // len(states_to_scrape)
+        # Every state waits on a shared queue; a worker takes the next one as soon as it is free
+        states_to_scrape = states or self.us_states
+        finished = self.finished_searches()
+        states_to_scrape = [state for state in states_to_scrape if state not in finished]
+        if budget is None:
+            self.stop_event.clear()
+            budget = ResultBudget(max_results, self.stop_event, collected=self.results_count)
+        else:
+            # Searches stop scrolling when any process meets the shared target
+            self.stop_event = budget.stop
+        scheduler = Scheduler(self.max_workers, budget)
         
         logger.info(f"Starting parallel scraping across {len(states_to_scrape)} states")
         logger.info(f"Using {self.max_workers} threads")
-        logger.info(f"Target: {max_results_per_state} results per state")
+        logger.info(f"Target: {max_results} results overall")
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Create futures for each state
-            futures = []
-            
-            for i, state in enumerate(states_to_scrape):
-                future = executor.submit(
-                    self.scrape_state, 
-                    query, 
-                    state, 
-                    max_results_per_state, 
-                    i % self.max_workers  # Distribute thread IDs
-                )
-                futures.append((future, state))
-
-            # Collect results as they complete
-            for future, state in futures:
-                try:
-                    state_results = future.result(timeout=1800)  # 30 minute timeout per state
-                    with self.results_lock:
-                        self.all_results.extend(state_results)
-                        logger.info(f"Completed {state}: {len(state_results)} results. Total: {len(self.all_results)}")
-                        
-                except concurrent.futures.TimeoutError:
-                    logger.error(f"Timeout scraping {state}")
-                except Exception as e:
-                    logger.error(f"Failed to scrape {state}: {e}")
-
-        return self.all_results[:max_results]
-
-    def save_to_csv(self, places, filename):
-        """Save results to CSV with additional metadata"""
-        if not places:
-            logger.warning("No data to save")
-            return
-            
-        df = pd.DataFrame(places)
+        def run_state(state, quota):
+            # The quota is this state's share of what is left, including what finished states did not use
+            return self.scrape_state(query, state, quota), None
+
+        def state_done(state, state_results, _):
+            total = self.count_results(state_results)
+            logger.info(f"Completed {state}: {len(state_results)} results. Total: {total}")
+            if on_results:
+                on_results(state, state_results)
+
+        scheduler.run(TaskQueue(states_to_scrape), run_state, state_done)
+
+        self.driver_pool.close()
+        logger.info(f"Scheduler: {scheduler.stats()}")
+        logger.info(f"Rate limiter: {self.rate_limiter.stats()}")
+        logger.info(f"Delay controller: {self.delay_controller.stats()}")
+        return self.results_count
+
+    def scrape_estate_firms_tiled(self, query="estate planning firm", max_results=5000, states=None,
+                                  cell_degrees=INITIAL_CELL_DEGREES):
+        """
+        Search every state as a grid of map viewports instead of one search per
+        state; a viewport that hits the Maps result cap is split into four
+        """
+        states_to_scrape = states or self.us_states
+        planner = TilePlanner(states_to_scrape, cell_degrees)
+        finished = self.finished_searches()
+        self.stop_event.clear()
+        budget = ResultBudget(max_results, self.stop_event, collected=self.results_count)
+        scheduler = Scheduler(self.max_workers, budget)
+        logger.info(f"Starting tiled scraping across {len(states_to_scrape)} states, "
+                    f"{planner.planned} initial cells, {self.max_workers} threads")
+
+        def run_tile(tile, _):
+            # A cell finished before a restart is only re-planned from its recorded card count
+            if tile.label in finished:
+                return [], finished[tile.label]
+            # Cells always scroll to the cap, or a full one could not be told apart
+            return self.scrape_tile(query, tile)
+
+        def tile_done(tile, tile_results, cards_seen):
+            # Full cells add their quadrants to the planner, which is the scheduler's queue
+            planner.report(tile, cards_seen)
+            total = self.count_results(tile_results)
+            logger.info(f"Completed {tile.label}: {len(tile_results)} new of {cards_seen} listed. Total: {total}")
+
+        scheduler.run(planner, run_tile, tile_done)
+
+        self.driver_pool.close()
+        logger.info(f"Tile planner: {planner.stats()}")
+        logger.info(f"Scheduler: {scheduler.stats()}")
+        logger.info(f"Rate limiter: {self.rate_limiter.stats()}")
+        logger.info(f"Delay controller: {self.delay_controller.stats()}")
+        return self.results_count
+
+    def scrape_estate_firms_sharded(self, query="estate planning firm", max_results=5000, processes=None):
+        """
+        Same searches as scrape_estate_firms_parallel, sharded across OS
+        processes that each run max_workers threads and their own driver pool.
+        The global request budget is split evenly between the processes, and
+        they all draw on one result budget of max_results.
+        """
+        finished = self.finished_searches()
+        states_to_scrape = [state for state in self.us_states if state not in finished]
+        if not states_to_scrape:
+            logger.info("Every state is already finished")
+            return self.results_count
+        processes = min(processes or os.cpu_count() or 1, len(states_to_scrape))
+
+        bucket = self.rate_limiter.global_bucket
+        config = {
+            'init': {
+                'max_workers': self.max_workers,
+                'headless': self.headless,
+                'extraction_mode': self.extraction_mode,
+                'max_tasks_per_driver': self.max_tasks_per_driver,
+                'block_resources': self.block_resources,
+            },
+            # Workers record into the checkpoint this process opened (and emptied unless resuming)
+            'checkpoint_path': self.checkpoint_path,
+            'proxy_config': self.proxy_config,
+            # Every process gets its share of the global budget; sessions keep their own pace
+            'rate_limiter': {
+                'rate': bucket.rate / processes,
+                'burst': max(1, bucket.burst // processes),
+                'session_rate': self.rate_limiter.session_rate,
+                'session_burst': self.rate_limiter.session_burst,
+                'jitter': self.rate_limiter.jitter,
+            },
+        }
+
+        def collect(state, state_results):
+            if self.sink:
+                self.sink.write_many(state_results)
+            total = self.count_results(state_results)
+            logger.info(f"Completed {state}: {len(state_results)} results. Total: {total}")
+
+        def collect_traffic(reports):
+            with self.results_lock:
+                self.traffic_reports.extend(reports)
+
+        # The processes share the persistent index directly; an in-memory set (with
+        # anything resumed from the checkpoint) is copied into a temporary one
+        if self.index_dir:
+            seen = {'seen_dir': self.index_dir}
+        else:
+            seen = {'seen_keys': self.seen_places.keys}
+        run_sharded(type(self), config, states_to_scrape, query, max_results, processes,
+                    on_results=collect, on_traffic=collect_traffic, collected=self.results_count, **seen)
+        return self.results_count
+
+    def scrape_estate_firms_multitab(self, query="estate planning firm", max_results=5000, tabs_per_browser=4):
+        """
+        Same searches as scrape_estate_firms_parallel, run as several tabs per
+        browser driven over DevTools instead of one browser per state at a time.
+        Cards are always read in batch, whatever the extraction mode.
+        """
+        finished = self.finished_searches()
+        states_to_scrape = [state for state in self.us_states if state not in finished]
+        # Each search gets its share of what is left as it starts, like scrape_estate_firms_parallel
+        self.stop_event.clear()
+        budget = ResultBudget(max_results, self.stop_event, collected=self.results_count)
+        browsers = min(self.max_workers, -(-len(states_to_scrape) // tabs_per_browser))
+
+        logger.info(f"Starting multi-tab scraping across {len(states_to_scrape)} states")
+        logger.info(f"Using {browsers} browsers with {tabs_per_browser} tabs each")
+
+        leases = []
+
+        def pace(browser):
+            self.delay_controller.backoff()
+            self.rate_limiter.acquire(leases[browser].session_id)
+
+        def search_done(result):
+            # Runs as each search finishes, so a crash only loses the searches still scrolling
+            lease = leases[result.browser]
+            if result.signal:
+                lease.failed = True
+
+            state_results = []
+            for card in result.cards:
+                place_id = place_key(card)
+                if not place_id or place_id in self.seen_places:
+                    continue
+                # Same record as scrape_state; the browser's pool slot is its thread id
+                place_data = self.place_from_card(card, lease.slot)
+                place_data['state'] = result.key
+                place_data['state_source'] = 'search'
+                if not place_data.get('name'):
+                    continue
+                place_data['place_key'] = place_id
+                if self.seen_places.add(place_id):
+                    state_results.append(place_data)
+                    if self.sink:
+                        self.sink.write(place_data)
+                    if self.checkpoint:
+                        self.checkpoint.add_place(place_id, result.key, place_data)
+            # A search cut short by the result budget is not done, a resumed run redoes it
+            if self.checkpoint and not result.signal and not self.stop_event.is_set():
+                self.checkpoint.finish_search(result.key, len(state_results), len(result.cards))
+
+            total = self.count_results(state_results)
+            logger.info(f"Completed {result.key}: {len(state_results)} results. Total: {total}")
+            return len(state_results)
+
+        try:
+            for _ in range(browsers):
+                leases.append(self.driver_pool.acquire())
+
+            engine = MultiTabEngine(
+                [debugger_address(lease.driver) for lease in leases],
+                tabs_per_browser,
+                blocked_patterns=self.blocked_patterns,
+                pace=pace,
+                on_signal=self.delay_controller.trouble,
+                on_healthy=self.delay_controller.healthy,
+                on_result=search_done,
+            )
+            searches = [
+                (state, f"https://www.google.co.in/maps/search/{query} {state} USA".replace(" ", "+"))
+                for state in states_to_scrape
+            ]
+
+            engine.run(searches, budget)
+
+        finally:
+            for lease in leases:
+                self.driver_pool.release(lease)
+            self.driver_pool.close()
+
+        logger.info(f"Result budget: {budget.stats()}")
+        logger.info(f"Rate limiter: {self.rate_limiter.stats()}")
+        logger.info(f"Delay controller: {self.delay_controller.stats()}")
+        return self.results_count
+
+    def save_summary(self):
+        """Close the streamed output and write the run summary next to it"""
+        if not self.sink:
+            logger.warning("No output file to summarize")
+            return None
+        # The records were written as they were found; only the last batch is left
+        self.sink.close()
         
         # Add summary statistics
         summary = {
-            'total_places': len(places),
-            'unique_states': len(df['state'].unique()) if 'state' in df.columns else 0,
+            **self.sink.summary(),
             'scraped_at': time.strftime("%Y-%m-%d %H:%M:%S"),
-            'proxy_used': 'DataImpulse Residential Proxies'
+            'proxy_used': 'DataImpulse Residential Proxies',
+            'transferred_bytes': sum(r['transferred_bytes'] for r in self.traffic_reports),
+            'blocked_requests': sum(r['blocked_requests'] for r in self.traffic_reports),
+            'estimated_bytes_saved': sum(r['estimated_bytes_saved'] for r in self.traffic_reports),
+            'traffic_by_state': self.traffic_reports,
+            'rate_limiter': self.rate_limiter.stats(),
+            'delay_controller': self.delay_controller.stats()
         }
         
-        # Save main data
-        df.to_csv(filename, index=False)
-        
         # Save summary
-        summary_filename = filename.replace('.csv', '_summary.json')
+        summary_filename = os.path.splitext(self.sink.filename)[0] + '_summary.json'
         with open(summary_filename, 'w') as f:
             json.dump(summary, f, indent=2)
         
-        logger.info(f"Data saved to {filename}")
         logger.info(f"Summary saved to {summary_filename}")
+        return summary
 
 
 def main():
     """
     IMPORTANT: Update proxy credentials before running!
     """
+    parser = argparse.ArgumentParser(description="Scrape estate planning firms through DataImpulse proxies")
+    parser.add_argument("--checkpoint", default="estate_firms_dataimpulse_checkpoint.db",
+                        help="SQLite file the run is checkpointed to")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the checkpointed run instead of starting over")
+    parser.add_argument("--index", default="estate_places_index",
+                        help="directory of the place index that dedups across runs")
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"], default="csv",
+                        help="output file format; results are written as they are found")
+    args = parser.parse_args()
+
+    # Results stream to this file from the start of the run
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    filename = f"estate_planning_firms_usa_{timestamp}.{args.format}"
     
     # Initialize scraper with proxy support
     scraper = ProxyMultithreadedEstateScraper(
         max_workers=5,  # Adjust based on your proxy plan
-        headless=False  # Set to True for production
+        headless=False,  # Set to True for production
+        checkpoint_path=args.checkpoint,
+        resume=args.resume,  # --resume skips finished states and seeds the dedup set
+        output=filename,
+        index_dir=args.index  # places found by earlier runs are skipped before extraction
     )
     
     # Update proxy credentials (REQUIRED!)
@@ -411,36 +784,29 @@ def main():
     try:
         logger.info("Starting multithreaded scraping with DataImpulse proxies...")
         
-        places = scraper.scrape_estate_firms_parallel(
+        total = scraper.scrape_estate_firms_parallel(
             query="estate planning firm",
             max_results=2000  # Start with smaller number for testing
         )
 
         # Display results summary
-        if places:
+        if total:
             print(f"\n{'='*50}")
             print(f"SCRAPING COMPLETED!")
             print(f"{'='*50}")
-            print(f"Total firms found: {len(places)}")
+            print(f"Total firms found: {total}")
             
             # Show sample results
             print(f"\nSample results:")
-            for idx, place in enumerate(places[:5], start=1):
+            for idx, place in enumerate(scraper.samples, start=1):
                 print(f"{idx}. {place.get('name', 'N/A')} - {place.get('state', 'N/A')} - Rating: {place.get('rating', 'N/A')}")
 
-            # Save results
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"estate_planning_firms_usa_{timestamp}.csv"
-            scraper.save_to_csv(places, filename)
-            
-            # Show state distribution
-            states = {}
-            for place in places:
-                state = place.get('state', 'Unknown')
-                states[state] = states.get(state, 0) + 1
+            # Close the streamed output and write the summary next to it
+            summary = scraper.save_summary()
             
+            # Show state distribution, counted by the sink as it wrote
             print(f"\nResults by state:")
-            for state, count in sorted(states.items()):
+            for state, count in sorted(summary['places_by_state'].items()):
                 print(f"  {state}: {count} firms")
                 
         else:
@@ -450,6 +816,8 @@ def main():
         logger.error(f"Error during scraping: {e}")
 
     finally:
+        if scraper.sink:
+            scraper.sink.close()
         logger.info("Scraping completed.")
 
 
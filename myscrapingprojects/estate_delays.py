@@ -6,8 +6,11 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import time
-import pandas as pd
 import random
+from maps_feed import CardStream, scroll_and_wait
+from maps_xhr import SearchCapture, enable_capture
+from result_sink import PLACE_FIELDS, ResultSink
+from adaptive_delay import AdaptiveDelay, detect_block
 
 
 # setting the logger
@@ -17,14 +20,22 @@ logger = logging.getLogger(__name__)
 
 
 class EstateScraper:
-  def __init__(self, headless=True):
-    """Initializing the driver to none just to use it later"""
+  def __init__(self, headless=True, extraction_mode="batch"):
+    """Initializing the driver to none just to use it later
+
+    extraction_mode: "batch" reads every new card in one execute_script call,
+    "xhr" decodes the search XHRs Maps fires while scrolling,
+    "element" queries each field of each card through its WebElement
+    """
     self.driver = None
+    self.extraction_mode = extraction_mode
+    # scales every pause below: up on throttling signals, down while healthy
+    self.delay_controller = AdaptiveDelay()
     self.setup_driver(headless)
 
   def human_delay(self, min_seconds=1, max_seconds=3):
-    """Add random delay to mimic human behavior"""
-    delay = random.uniform(min_seconds, max_seconds)
+    """Add random delay to mimic human behavior, at the controller's current pace"""
+    delay = self.delay_controller.scale(random.uniform(min_seconds, max_seconds))
     time.sleep(delay)
 
   def setup_driver(self, headless):
@@ -37,6 +48,8 @@ class EstateScraper:
     chrome_options.add_argument("--disable-blink-features=AutomationControlled")
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
+    if self.extraction_mode == "xhr":
+      enable_capture(chrome_options)
     
     # Add more human-like browser settings
     chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
@@ -64,7 +77,7 @@ class EstateScraper:
     def safe_extract(selector, attribute=None, container=place_element):
         try:
             # Small delay before each extraction to mimic human reading time
-            time.sleep(random.uniform(0.1, 0.3))
+            self.human_delay(0.1, 0.3)
             elem = container.find_element(By.CSS_SELECTOR, selector)
             return elem.get_attribute(attribute) if attribute else elem.text.strip()
         except NoSuchElementException:
@@ -87,14 +100,36 @@ class EstateScraper:
     return data
 
 
-  def search_places(self, query, location, max_results=10):
+  def place_from_card(self, card):
+    """building the same record as extract_place_data from batch-extracted card fields"""
+    return {
+      'name': card.get('name'),
+      'rating': card.get('rating'),
+      'address': card.get('address'),
+      # place id, cid, coordinates... when the card came from a search XHR
+      **(card.get('extra') or {}),
+    }
+
+
+  def search_places(self, query, location, max_results=10, output=None):
+    """searching and, with output (.csv, .jsonl or .parquet), writing each place as it is found"""
+    sink = ResultSink(output, PLACE_FIELDS) if output else None
+    try:
+      return self.scrape_places(query, location, max_results, sink)
+    finally:
+      if sink:
+        sink.close()
+
+
+  def scrape_places(self, query, location, max_results, sink=None):
     """let's build the url to search for places"""
     search_query = f"{query} {location}".replace(" ", "+")
     url = f"https://www.google.co.in/maps/search/{search_query}"
 
     logger.info(f"Searching for: {search_query}")
     
-    # Human-like delay before navigation
+    # Human-like delay before navigation, longer while recovering from a block
+    self.delay_controller.backoff()
     self.human_delay(1, 2)
     
     self.driver.get(url)
@@ -102,6 +137,11 @@ class EstateScraper:
     # Mimic human behavior - wait a bit after page load as humans would
     self.human_delay(3, 5)
 
+    signal = detect_block(self.driver)
+    if signal:
+      self.delay_controller.trouble(signal, location)
+      return []
+
     # Wait for the results to load
     try:
       wait = WebDriverWait(self.driver, 15)  # Increased timeout
@@ -112,6 +152,7 @@ class EstateScraper:
 
     except TimeoutException:
       logger.error("Timeout waiting for page to load")
+      self.delay_controller.trouble(detect_block(self.driver) or "feed_timeout", location)
       return []
       
     places = []
@@ -127,52 +168,68 @@ class EstateScraper:
     except NoSuchElementException:
       logger.error("Could not find the results container")
       return places
+
+    # start listening for the search XHRs before the first scroll
+    capture = SearchCapture(self.driver) if self.extraction_mode == "xhr" else None
+    cards = CardStream(self.driver, results_panel, "div.Nv2PK.tH5CWc.THOPZb", self.extraction_mode, capture)
     
 
     previous_count = 0
     no_new_results_count = 0
     scroll_count = 0
+    end_of_list = False
     
     while len(places) < max_results:
-      # getting the current places elements
-      place_elements = results_panel.find_elements(By.CSS_SELECTOR, "div.Nv2PK.tH5CWc.THOPZb ")
+      # only the cards rendered since the last pass
+      place_elements = cards.next_cards()
+      if scroll_count == 0 and not place_elements:
+        self.delay_controller.trouble("empty_feed", location)
 
-      for place_element in place_elements[len(places):]:
+      for place_element in place_elements:
         # only process new elements
         if len(places) >= max_results:
           break
 
         try:
-          # Human-like delay before processing each place
-          self.human_delay(0.5, 1.5)
-          
-          place_data = self.extract_place_data(place_element)
+          if self.extraction_mode in ("batch", "xhr"):
+            # nothing is read from the browser per card, so no reading delays either
+            place_data = self.place_from_card(place_element)
+          else:
+            # Human-like delay before processing each place
+            self.human_delay(0.5, 1.5)
+
+            place_data = self.extract_place_data(place_element)
 
           # Avoid duplicates
           place_id = f"{place_data.get('name', '')}_{place_data.get('address', '')}"
           if place_id not in seen_places and place_data.get('name'):
             places.append(place_data)
+            if sink:
+              sink.write(place_data)
             seen_places.add(place_id)
             logger.info(f"Scraped: {place_data.get('name', 'Unknown')}")
             
             # Brief pause after successful extraction (human would take time to read/process)
-            time.sleep(random.uniform(0.2, 0.5))
+            if self.extraction_mode == "element":
+              self.human_delay(0.2, 0.5)
 
         except Exception as e:
           logger.error(f"Error extracting place data: {e}")
           # Even on errors, add a small delay
-          time.sleep(random.uniform(0.1, 0.3))
+          self.human_delay(0.1, 0.3)
           continue
 
+      # Maps showed its end-of-list marker and the last cards are processed
+      if end_of_list:
+          logger.info("Reached the end of the results list")
+          break
+
       # Check if we found new results
       if len(places) == previous_count:
           no_new_results_count += 1
           if no_new_results_count >= 3:  # Stop if no new results after 3 attempts
               logger.info("No more new results found, stopping scroll")
               break
-          
-          # If no new results, wait a bit longer before trying again
-          self.human_delay(2, 4)
       else:
           no_new_results_count = 0
 
@@ -182,39 +239,36 @@ class EstateScraper:
       # Scroll down to load more results with human-like behavior
       # Vary scroll amount slightly to mimic human scrolling
       scroll_amount = random.randint(800, 1200)
-      self.driver.execute_script(f"arguments[0].scrollTop += {scroll_amount}", results_panel)
+      # Returns as soon as the new results render, no fixed wait for them
+      self.delay_controller.backoff()
+      _, grew, end_of_list = scroll_and_wait(self.driver, results_panel, "div.Nv2PK.tH5CWc.THOPZb", scroll_amount)
+      if grew:
+        self.delay_controller.healthy()
+      elif not end_of_list:
+        signal = detect_block(self.driver)
+        if signal:
+          self.delay_controller.trouble(signal, location)
       
-      # Variable delay after scrolling - humans don't scroll at constant intervals
+      # Reading pauses - humans don't scroll at constant intervals
       if scroll_count % 5 == 0:
           # Longer pause every 5 scrolls (human might take a break to read)
           self.human_delay(5, 8)
       elif scroll_count % 3 == 0:
           # Medium pause every 3 scrolls
           self.human_delay(3, 5)
-      else:
-          # Regular pause between scrolls
-          self.human_delay(2, 4)
       
-      logger.info(f"Currently scraped {len(places)} places (Scroll #{scroll_count})")
+      logger.info(f"Currently scraped {len(places)} places (Scroll #{scroll_count}, "
+                  f"delay factor {self.delay_controller.factor:.2f})")
       
       # Add occasional longer breaks to really mimic human behavior
       if scroll_count % 10 == 0:
           logger.info("Taking a longer break to mimic human behavior...")
           self.human_delay(8, 15)
 
+    logger.info(f"Delay controller: {self.delay_controller.stats()}")
     return places[:max_results]
 
 
-  def save_to_csv(self, places, filename):
-     """save data to csv using pandas"""
-     # Small delay before saving (human would take time to decide on filename, etc.)
-     self.human_delay(1, 2)
-     
-     df = pd.DataFrame(places)
-     df.to_csv(filename, index=False)
-     logger.info(f"Data saved to {filename}")
-
-
   def close(self):
     """Close the browser driver"""
     # Human-like delay before closing (human would take time to close browser)
@@ -236,7 +290,8 @@ def main():
     places = scraper.search_places(
       query="estate planning firm",
       location = "usa",
-      max_results=10000
+      max_results=10000,
+      output="estate_planning_firms_usa.csv"  # written as the places are found
     )
 
     # print results with human-like delay between each print
@@ -248,9 +303,6 @@ def main():
       else:
           time.sleep(random.uniform(0.1, 0.3))
 
-    # Finally let's save to csv
-    scraper.save_to_csv(places, "estate_planning_firms_usa.csv")
-
   except Exception as e:
     logger.error(f"Error occurred during scraping: {e}")
 
@@ -0,0 +1,217 @@
+"""
+Geographic tiling of the state searches
+
+One Maps search stops at about 120 results, however far the feed is
+scrolled, so "estate planning firm California USA" only ever shows a
+sliver of California. TilePlanner instead covers every state's bounding
+box with viewport cells and searches each one through the
+/maps/search/<query>/@lat,lng,zoomz URL form, which searches the area on
+screen. A cell whose search comes back full is split into four smaller
+cells, so dense metros get tiled finely while empty land costs a single
+search, and coverage grows with the number of workers rather than with
+scroll depth.
+
+Cells are rectangles, so the ones along a border also cover the
+neighbouring state; a tiled place takes its state from its address.
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import deque, namedtuple
+from urllib.parse import quote_plus
+
+logger = logging.getLogger(__name__)
+
+# Maps stops a search at about 120 results; a cell that comes this close is full
+RESULT_CAP = 120
+SATURATION = 0.9
+MAX_DEPTH = 5               # a 2 degree cell stops splitting at about 7 km across
+INITIAL_CELL_DEGREES = 2.0  # side of the first cells laid over a state
+VIEWPORT_PX = (1024, 768)   # browser viewport the zoom level is fitted to
+MIN_ZOOM, MAX_ZOOM = 5, 18
+
+# (south, west, north, east) of every state, generous to the nearest 0.01 degree
+STATE_BOUNDS = {
+    'Alabama': (30.14, -88.47, 35.01, -84.89),
+    'Alaska': (51.20, -179.15, 71.44, -129.98),
+    'Arizona': (31.33, -114.82, 37.00, -109.04),
+    'Arkansas': (33.00, -94.62, 36.50, -89.64),
+    'California': (32.53, -124.41, 42.01, -114.13),
+    'Colorado': (36.99, -109.06, 41.00, -102.04),
+    'Connecticut': (40.98, -73.73, 42.05, -71.79),
+    'Delaware': (38.45, -75.79, 39.84, -75.05),
+    'Florida': (24.52, -87.63, 31.00, -80.03),
+    'Georgia': (30.36, -85.61, 35.00, -80.84),
+    'Hawaii': (18.91, -160.24, 22.24, -154.81),
+    'Idaho': (41.99, -117.24, 49.00, -111.04),
+    'Illinois': (36.97, -91.51, 42.51, -87.49),
+    'Indiana': (37.77, -88.10, 41.76, -84.78),
+    'Iowa': (40.38, -96.64, 43.50, -90.14),
+    'Kansas': (36.99, -102.05, 40.00, -94.59),
+    'Kentucky': (36.50, -89.57, 39.15, -81.96),
+    'Louisiana': (28.93, -94.04, 33.02, -88.82),
+    'Maine': (43.06, -71.08, 47.46, -66.95),
+    'Maryland': (37.91, -79.49, 39.72, -75.05),
+    'Massachusetts': (41.24, -73.51, 42.89, -69.93),
+    'Michigan': (41.70, -90.42, 48.31, -82.41),
+    'Minnesota': (43.50, -97.24, 49.38, -89.49),
+    'Mississippi': (30.17, -91.66, 35.00, -88.10),
+    'Missouri': (35.99, -95.77, 40.61, -89.10),
+    'Montana': (44.36, -116.05, 49.00, -104.04),
+    'Nebraska': (40.00, -104.05, 43.00, -95.31),
+    'Nevada': (35.00, -120.01, 42.00, -114.04),
+    'New Hampshire': (42.70, -72.56, 45.31, -70.61),
+    'New Jersey': (38.93, -75.56, 41.36, -73.89),
+    'New Mexico': (31.33, -109.05, 37.00, -103.00),
+    'New York': (40.50, -79.76, 45.02, -71.86),
+    'North Carolina': (33.84, -84.32, 36.59, -75.46),
+    'North Dakota': (45.94, -104.05, 49.00, -96.55),
+    'Ohio': (38.40, -84.82, 41.98, -80.52),
+    'Oklahoma': (33.62, -103.00, 37.00, -94.43),
+    'Oregon': (41.99, -124.57, 46.29, -116.46),
+    'Pennsylvania': (39.72, -80.52, 42.27, -74.69),
+    'Rhode Island': (41.15, -71.86, 42.02, -71.12),
+    'South Carolina': (32.03, -83.35, 35.22, -78.54),
+    'South Dakota': (42.48, -104.06, 45.95, -96.44),
+    'Tennessee': (34.98, -90.31, 36.68, -81.65),
+    'Texas': (25.84, -106.65, 36.50, -93.51),
+    'Utah': (37.00, -114.05, 42.00, -109.04),
+    'Vermont': (42.73, -73.44, 45.02, -71.46),
+    'Virginia': (36.54, -83.68, 39.47, -75.24),
+    'Washington': (45.54, -124.76, 49.00, -116.92),
+    'West Virginia': (37.20, -82.64, 40.64, -77.72),
+    'Wisconsin': (42.49, -92.89, 47.08, -86.25),
+    'Wyoming': (40.99, -111.06, 45.01, -104.05),
+}
+
+STATE_CODES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
+    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'FL': 'Florida', 'GA': 'Georgia',
+    'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa',
+    'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi', 'MO': 'Missouri',
+    'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada', 'NH': 'New Hampshire', 'NJ': 'New Jersey',
+    'NM': 'New Mexico', 'NY': 'New York', 'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio',
+    'OK': 'Oklahoma', 'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina',
+    'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont',
+    'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming',
+}
+
+# A comma-separated part of an address that may name the state: "OH 43215", "OH" or "Ohio 43215"
+ADDRESS_PART_RE = re.compile(
+    r",\s*(?:([A-Z]{2})(?:\s+\d{5}(?:-\d{4})?)?|([A-Z][a-z]+(?: [A-Z][a-z]+)?)\s+\d{5}(?:-\d{4})?)\s*(?=,|$)"
+)
+
+
+def state_from_address(address):
+    """The state an address ends in, or None (DOM cards often show only the street)"""
+    parts = ADDRESS_PART_RE.findall(address or "")
+    if not parts:
+        return None
+    # The last part wins, so "Washington, DC 20001" is no state rather than Washington
+    code, name = parts[-1]
+    return STATE_CODES.get(code) if code else (name if name in STATE_BOUNDS else None)
+
+
+def place_state(address, tile_state):
+    """(state, source) of a tiled place: its address's state, else its cell's"""
+    state = state_from_address(address)
+    return (state, 'address') if state else (tile_state, 'tile')
+
+
+class Tile(namedtuple('Tile', ['state', 'south', 'west', 'north', 'east', 'depth'])):
+    """One lat/lng viewport cell of a state"""
+
+    @property
+    def center(self):
+        return (self.south + self.north) / 2, (self.west + self.east) / 2
+
+    @property
+    def zoom(self):
+        """Deepest zoom whose viewport still shows the whole cell"""
+        lat, _ = self.center
+        # Web Mercator: the world is 256 * 2**zoom px wide, and latitude is
+        # stretched by 1/cos(lat) relative to longitude
+        width, height = VIEWPORT_PX
+        lng_span = self.east - self.west
+        lat_span = (self.north - self.south) / math.cos(math.radians(lat))
+        zoom = min(math.log2(360 * width / (256 * lng_span)), math.log2(360 * height / (256 * lat_span)))
+        return max(MIN_ZOOM, min(MAX_ZOOM, math.floor(zoom)))
+
+    @property
+    def label(self):
+        lat, lng = self.center
+        return f"{self.state} @{lat:.3f},{lng:.3f} z{self.zoom}"
+
+    def url(self, query, host="https://www.google.co.in"):
+        lat, lng = self.center
+        return f"{host}/maps/search/{quote_plus(query)}/@{lat:.6f},{lng:.6f},{self.zoom}z"
+
+    def split(self):
+        """The four quadrants of this cell"""
+        lat, lng = self.center
+        return [
+            Tile(self.state, south, west, north, east, self.depth + 1)
+            for south, north in ((self.south, lat), (lat, self.north))
+            for west, east in ((self.west, lng), (lng, self.east))
+        ]
+
+
+def state_tiles(state, cell_degrees=INITIAL_CELL_DEGREES):
+    """Cover a state's bounding box with cells of about cell_degrees a side"""
+    south, west, north, east = STATE_BOUNDS[state]
+    rows = max(1, math.ceil((north - south) / cell_degrees))
+    cols = max(1, math.ceil((east - west) / cell_degrees))
+    lat_step = (north - south) / rows
+    lng_step = (east - west) / cols
+    return [
+        Tile(state, south + r * lat_step, west + c * lng_step, south + (r + 1) * lat_step, west + (c + 1) * lng_step, 0)
+        for r in range(rows) for c in range(cols)
+    ]
+
+
+def saturated(cards_seen, result_cap=RESULT_CAP):
+    """Whether a search returned about as many cards as Maps ever shows"""
+    return cards_seen >= result_cap * SATURATION
+
+
+class TilePlanner:
+    """Thread-safe queue of cells to search, split further when a search comes back full"""
+
+    def __init__(self, states, cell_degrees=INITIAL_CELL_DEGREES, max_depth=MAX_DEPTH, result_cap=RESULT_CAP):
+        self.max_depth = max_depth
+        self.result_cap = result_cap
+        self.pending = deque(tile for state in states for tile in state_tiles(state, cell_degrees))
+        self.planned = len(self.pending)
+        self.searched = 0
+        self.splits = 0
+        self.lock = threading.Lock()
+
+    def next_task(self):
+        """Next cell to search, or None when nothing is pending"""
+        with self.lock:
+            return self.pending.popleft() if self.pending else None
+
+    def report(self, tile, cards_seen):
+        """Record a finished search; returns the cells it was split into, if any"""
+        with self.lock:
+            self.searched += 1
+            if not saturated(cards_seen, self.result_cap) or tile.depth >= self.max_depth:
+                return []
+            children = tile.split()
+            # Searched before the cells still waiting, so dense areas finish first
+            self.pending.extendleft(reversed(children))
+            self.planned += len(children)
+            self.splits += 1
+        logger.info(f"{tile.label} is full ({cards_seen} cards), split into {len(children)} cells")
+        return children
+
+    def __len__(self):
+        return len(self.pending)
+
+    def stats(self):
+        with self.lock:
+            return {'tiles_planned': self.planned, 'tiles_searched': self.searched, 'splits': self.splits,
+                    'tiles_pending': len(self.pending)}
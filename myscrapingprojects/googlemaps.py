@@ -4,11 +4,9 @@ Google Maps Scraper using Selenium
 Scrapes business information from Google Maps search results
 
 Required packages:
-pip install selenium beautifulsoup4 pandas
+pip install selenium parsel
 """
 
-import time
-import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -16,15 +14,62 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import logging
+from parsel import Selector
+from maps_feed import CardStream, scroll_and_wait
+from maps_xhr import SearchCapture, enable_capture
+from result_sink import MAPS_FIELDS, ResultSink
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CARD_SELECTOR = "div.Nv2PK.THOPZb.CpccDe"
+
+
+def node_text(node):
+    """Visible text of a parsed node, close to what innerText returns:
+    one line per child div, inline text pieces joined by single spaces"""
+    blocks = node.xpath("./div")
+    if blocks:
+        return "\n".join(text for text in (node_text(block) for block in blocks) if text)
+    return " ".join(t.strip() for t in node.css("::text").getall() if t.strip())
+
+
+def parse_feed_html(html):
+    """Parse the raw fields of every card out of a feed snapshot or a run of card HTML
+    
+    Pure function of the HTML string, so it runs without a browser and can
+    be handed to a process pool
+    """
+    cards = []
+    for card in Selector(text=html).css(CARD_SELECTOR):
+        name = card.css(".qBF1Pd.fontHeadlineSmall")
+        category = card.css(".W4Efsd .W4Efsd")
+        cards.append({
+            'name': node_text(name[0]) if name else None,
+            'rating_label': card.css("span[role='img'][aria-label*='stars']::attr(aria-label)").get(),
+            'category': node_text(category[0]) if category else None,
+            'info': [node_text(container) for container in card.css(".W4Efsd")],
+            'google_url': card.css("a.hfpxzc::attr(href)").get(),
+        })
+    return cards
+
+
 class GoogleMapsScraper:
-    def __init__(self, headless=True):
-        """Initialize the scraper with Chrome driver options"""
+    def __init__(self, headless=True, extraction_mode="batch"):
+        """Initialize the scraper with Chrome driver options
+        
+        Args:
+            headless (bool): Run Chrome without a window
+            extraction_mode (str): "batch" reads every new card in one
+                execute_script call, "html" snapshots the HTML of the new
+                cards once per scroll and parses it in-process with parsel,
+                "xhr" decodes the search XHRs Maps fires while scrolling
+                (adds place id, CID and coordinates), "element" queries
+                each field through its WebElement
+        """
         self.driver = None
+        self.extraction_mode = extraction_mode
         self.setup_driver(headless)
         
     def setup_driver(self, headless=True):
@@ -37,6 +82,8 @@ class GoogleMapsScraper:
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
+        if self.extraction_mode == "xhr":
+            enable_capture(chrome_options)
         
         try:
             self.driver = webdriver.Chrome(options=chrome_options)
@@ -45,7 +92,7 @@ class GoogleMapsScraper:
             logger.error(f"Failed to initialize Chrome driver: {e}")
             raise
     
-    def search_places(self, query, location="", max_results=20):
+    def search_places(self, query, location="", max_results=20, output=None):
         """
         Search for places on Google Maps
         
@@ -53,10 +100,20 @@ class GoogleMapsScraper:
             query (str): Search query (e.g., "restaurants", "hotels")
             location (str): Location to search in (e.g., "New York, NY")
             max_results (int): Maximum number of results to scrape
+            output (str): File (.csv, .jsonl or .parquet) each place is written to as it is found
         
         Returns:
             list: List of dictionaries containing place information
         """
+        sink = ResultSink(output, MAPS_FIELDS) if output else None
+        try:
+            return self.scrape_places(query, location, max_results, sink)
+        finally:
+            if sink:
+                sink.close()
+
+    def scrape_places(self, query, location, max_results, sink=None):
+        """Scroll the results of one search, writing each new place to sink"""
         search_query = f"{query} {location}".strip()
         url = f"https://www.google.com/maps/search/{search_query.replace(' ', '+')}"
         
@@ -82,24 +139,34 @@ class GoogleMapsScraper:
             logger.error("Could not find results panel")
             return []
         
+        # Start listening for the search XHRs before the first scroll
+        capture = SearchCapture(self.driver) if self.extraction_mode == "xhr" else None
+        cards = CardStream(self.driver, results_panel, CARD_SELECTOR, self.extraction_mode, capture, parse_html=parse_feed_html)
+        
         previous_count = 0
         no_new_results_count = 0
+        end_of_list = False
         
         while len(places) < max_results:
-            # Get current place elements - they are divs with class containing "Nv2PK"
-            place_elements = self.driver.find_elements(By.CSS_SELECTOR, "div.Nv2PK.THOPZb.CpccDe")
+            # Only the cards rendered since the last pass
+            place_elements = cards.next_cards()
             
-            for element in place_elements[len(places):]:  # Only process new elements
+            for element in place_elements:  # Only process new elements
                 if len(places) >= max_results:
                     break
                     
                 try:
-                    place_data = self.extract_place_data(element)
+                    if self.extraction_mode in ("batch", "html", "xhr"):
+                        place_data = self.place_from_card(element)
+                    else:
+                        place_data = self.extract_place_data(element)
                     
                     # Avoid duplicates
                     place_id = f"{place_data.get('name', '')}_{place_data.get('address', '')}"
                     if place_id not in seen_places and place_data.get('name'):
                         places.append(place_data)
+                        if sink:
+                            sink.write(place_data)
                         seen_places.add(place_id)
                         logger.info(f"Scraped: {place_data.get('name', 'Unknown')}")
                         
@@ -107,6 +174,11 @@ class GoogleMapsScraper:
                     logger.warning(f"Error extracting place data: {e}")
                     continue
             
+            # Maps showed its end-of-list marker and the last cards are processed
+            if end_of_list:
+                logger.info("Reached the end of the results list")
+                break
+            
             # Check if we found new results
             if len(places) == previous_count:
                 no_new_results_count += 1
@@ -118,9 +190,8 @@ class GoogleMapsScraper:
             
             previous_count = len(places)
             
-            # Scroll down to load more results
-            self.driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight", results_panel)
-            time.sleep(3)  # Longer wait for content to load
+            # Scroll down and wait only until more results render or the list ends
+            _, _, end_of_list = scroll_and_wait(self.driver, results_panel, CARD_SELECTOR)
             
             logger.info(f"Currently scraped {len(places)} places")
         
@@ -128,7 +199,6 @@ class GoogleMapsScraper:
     
     def extract_place_data(self, element):
         """Extract data from a single place element based on the actual HTML structure"""
-        data = {}
         
         # Helper function to safely extract text from elements
         def safe_extract(selector, attribute=None, container=element):
@@ -138,20 +208,43 @@ class GoogleMapsScraper:
             except NoSuchElementException:
                 return None
         
+        # Get all W4Efsd containers for processing (text read once per container)
+        try:
+            info_containers = element.find_elements(By.CSS_SELECTOR, ".W4Efsd")
+        except NoSuchElementException:
+            info_containers = []
+        
+        card = {
+            'name': safe_extract(".qBF1Pd.fontHeadlineSmall"),
+            'rating_label': safe_extract("span[role='img'][aria-label*='stars']", "aria-label"),
+            'category': safe_extract(".W4Efsd .W4Efsd"),
+            'info': [container.text.strip() for container in info_containers],
+            'google_url': safe_extract("a.hfpxzc", "href"),
+        }
+        return self.place_from_card(card)
+    
+    def place_from_card(self, card):
+        """Build the place record from the raw text fields of one card
+        
+        The card comes from extract_place_data (element mode),
+        maps_feed.extract_cards (batch mode) or parse_feed_html (html mode)
+        """
+        data = {}
+        info_texts = card.get('info') or []
+        
         # Helper function to search text in multiple containers
-        def search_in_containers(containers, patterns, extract_func=None):
-            for container in containers:
-                text = container.text.strip()
+        def search_in_containers(texts, patterns, extract_func=None):
+            for text in texts:
                 for pattern in patterns:
                     if pattern.lower() in text.lower():
                         return extract_func(text) if extract_func else text
             return None
         
         # Extract name
-        data['name'] = safe_extract(".qBF1Pd.fontHeadlineSmall")
+        data['name'] = card.get('name')
         
         # Extract rating and reviews from aria-label
-        rating_elem = safe_extract("span[role='img'][aria-label*='stars']", "aria-label")
+        rating_elem = card.get('rating_label')
         if rating_elem:
             # Parse "4.8 stars 1,459 Reviews"
             parts = rating_elem.split()
@@ -167,16 +260,10 @@ class GoogleMapsScraper:
             data['rating'] = None
             data['reviews_count'] = None
         
-        # Get all W4Efsd containers for processing
-        try:
-            info_containers = element.find_elements(By.CSS_SELECTOR, ".W4Efsd")
-        except NoSuchElementException:
-            info_containers = []
-        
         # Extract address (contains street indicators)
         street_indicators = ['st', 'ave', 'blvd', 'rd', 'drive', 'lane', 'way']
         data['address'] = search_in_containers(
-            info_containers, 
+            info_texts, 
             street_indicators,
             lambda text: text.split('·')[-1].strip() if '·' in text else text
         )
@@ -190,40 +277,35 @@ class GoogleMapsScraper:
                         return part.strip()
             return text if '$' in text else None
         
-        data['price_range'] = search_in_containers(info_containers, ['$'], extract_price)
+        data['price_range'] = search_in_containers(info_texts, ['$'], extract_price)
         
         # Extract category (usually first item)
-        try:
-            category_container = element.find_element(By.CSS_SELECTOR, ".W4Efsd .W4Efsd")
-            category_text = category_container.text.strip()
+        category_text = card.get('category')
+        if category_text is not None:
             data['category'] = category_text.split('·')[0].strip() if '·' in category_text else category_text
-        except NoSuchElementException:
+        else:
             data['category'] = None
         
         # Extract hours/status
-        data['hours_status'] = search_in_containers(info_containers, ['open', 'closed'])
+        data['hours_status'] = search_in_containers(info_texts, ['open', 'closed'])
         
         # Extract description (longer text that doesn't match other patterns)
         description = None
         skip_patterns = ['st ', 'ave ', 'blvd ', 'rd ', 'open', 'closed', 'coffee shop', 'cafe', '·']
-        for container in info_containers:
-            text = container.text.strip()
+        for text in info_texts:
             if len(text) > 10 and not any(pattern in text.lower() for pattern in skip_patterns):
                 description = text
                 break
         data['description'] = description
         
         # Extract Google Maps URL
-        data['google_url'] = safe_extract("a.hfpxzc", "href")
+        data['google_url'] = card.get('google_url')
+        
+        # Place id, CID, coordinates... when the card came from a search XHR
+        data.update(card.get('extra') or {})
         
         return data
     
-    def save_to_csv(self, data, filename):
-        """Save scraped data to CSV file"""
-        df = pd.DataFrame(data)
-        df.to_csv(filename, index=False)
-        logger.info(f"Data saved to {filename}")
-    
     def close(self):
         """Close the browser driver"""
         if self.driver:
@@ -238,7 +320,8 @@ def main():
         places = scraper.search_places(
             query="coffee shops",
             location="Seattle, WA",
-            max_results=25
+            max_results=25,
+            output="google_maps_results.csv"  # written as the places are found
         )
         
         # Print results
@@ -253,9 +336,6 @@ def main():
             print(f"   Description: {place.get('description', 'N/A')}")
             print(f"   Google URL: {place.get('google_url', 'N/A')}")
         
-        # Save to CSV
-        scraper.save_to_csv(places, "google_maps_results.csv")
-        
     except Exception as e:
         logger.error(f"Error during scraping: {e}")
     finally:
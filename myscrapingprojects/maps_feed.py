@@ -0,0 +1,175 @@
+"""
+Helpers shared by the Google Maps scrapers for reading the results feed
+
+The feed is the scrollable div[role='feed'] panel; every result in it is
+a card element. These helpers work on the live page through one
+execute_script call instead of one WebDriver round trip per field.
+"""
+
+import json
+import logging
+
+from selenium.webdriver.common.by import By
+
+logger = logging.getLogger(__name__)
+
+
+# Attribute set on every card once it has been handed to a scraper
+SEEN_ATTRIBUTE = "data-scraped"
+
+# Pull every field any of the scrapers reads from the cards not tagged
+# yet, and tag them, in one pass over the DOM. Selectors mirror
+# extract_place_data.
+EXTRACT_CARDS_JS = """
+const [feed, cardSelector, seen] = arguments;
+const cards = feed.querySelectorAll(`${cardSelector}:not([${seen}])`);
+const text = (root, selector) => {
+    const el = root.querySelector(selector);
+    return el ? el.innerText.trim() : null;
+};
+const attr = (root, selector, name) => {
+    const el = root.querySelector(selector);
+    return el ? el.getAttribute(name) : null;
+};
+const href = (root, selector) => {
+    const el = root.querySelector(selector);
+    return el ? el.href : null;
+};
+const out = [];
+for (const card of cards) {
+    card.setAttribute(seen, "");
+    out.push({
+        name: text(card, ".qBF1Pd.fontHeadlineSmall"),
+        rating: text(card, "span.MW4etd"),
+        rating_label: attr(card, "span[role='img'][aria-label*='stars']", "aria-label"),
+        address: text(card, "div.W4Efsd span:nth-of-type(3)"),
+        phone: attr(card, "span[data-value]", "data-value"),
+        website: href(card, "a[data-value]"),
+        hours: text(card, "div.t39EBf span"),
+        category: text(card, ".W4Efsd .W4Efsd"),
+        info: Array.from(card.querySelectorAll(".W4Efsd"), el => el.innerText.trim()),
+        google_url: href(card, "a.hfpxzc"),
+    });
+}
+return JSON.stringify(out);
+"""
+
+
+# The HTML of the cards not tagged yet, tagged in the same pass, for html mode
+UNSEEN_CARDS_HTML_JS = """
+const [feed, cardSelector, seen] = arguments;
+const out = [];
+for (const card of feed.querySelectorAll(`${cardSelector}:not([${seen}])`)) {
+    card.setAttribute(seen, "");
+    out.push(card.outerHTML);
+}
+return out.join("");
+"""
+
+
+# Tag WebElements handed out by element mode
+MARK_SEEN_JS = """
+const [cards, seen] = arguments;
+for (const card of cards) card.setAttribute(seen, "");
+"""
+
+
+def extract_cards(driver, feed, card_selector):
+    """Return the raw fields of every card not extracted yet, in one round trip"""
+    payload = driver.execute_script(EXTRACT_CARDS_JS, feed, card_selector, SEEN_ATTRIBUTE)
+    return json.loads(payload) if payload else []
+
+
+class CardStream:
+    """Hands out every card of the feed exactly once, across scrolls
+
+    batch, html and element modes tag the cards they return with
+    SEEN_ATTRIBUTE and only query untagged ones, so each call costs the new
+    cards only and nothing depends on how many places the scraper kept.
+    xhr mode hands over to the SearchCapture, which only ever sees each
+    response once.
+    """
+
+    def __init__(self, driver, feed, card_selector, extraction_mode="batch", capture=None, parse_html=None):
+        self.driver = driver
+        self.feed = feed
+        self.card_selector = card_selector.strip()
+        self.extraction_mode = extraction_mode
+        self.capture = capture
+        self.parse_html = parse_html
+
+    def next_cards(self):
+        """Cards rendered since the previous call: card dicts, or WebElements in element mode"""
+        if self.extraction_mode == "xhr":
+            return self.capture.next_cards(self.feed, self.card_selector)
+
+        if self.extraction_mode == "html":
+            # One round trip for the new cards' HTML, the parsing is CPU-only
+            html = self.driver.execute_script(UNSEEN_CARDS_HTML_JS, self.feed, self.card_selector, SEEN_ATTRIBUTE)
+            return self.parse_html(html) if html else []
+
+        if self.extraction_mode == "element":
+            elements = self.feed.find_elements(By.CSS_SELECTOR, f"{self.card_selector}:not([{SEEN_ATTRIBUTE}])")
+            if elements:
+                self.driver.execute_script(MARK_SEEN_JS, elements, SEEN_ATTRIBUTE)
+            return elements
+
+        return extract_cards(self.driver, self.feed, self.card_selector)
+
+
+# Selector of Maps' "You've reached the end of the list." marker
+END_OF_LIST_SELECTOR = "span.HlvSq"
+
+# Longest a scroll waits for new cards. Must stay below the driver's
+# script timeout (30 s by default) since the wait runs as an async script.
+FEED_WAIT_TIMEOUT = 5
+
+# Scroll the feed, then resolve as soon as more cards are rendered or the
+# end-of-list marker shows up (MutationObserver), or when the timeout hits.
+# A scroll that stays clear of the bottom loads nothing, so it resolves
+# right away instead of waiting out the timeout.
+SCROLL_AND_WAIT_JS = """
+const [feed, cardSelector, scrollBy, endSelector, timeoutMs, done] = arguments;
+const state = () => ({
+    count: feed.querySelectorAll(cardSelector).length,
+    end: !!document.querySelector(endSelector),
+});
+const before = state().count;
+if (scrollBy === null) {
+    feed.scrollTop = feed.scrollHeight;
+} else {
+    feed.scrollTop += scrollBy;
+}
+const nearBottom = feed.scrollTop + 2 * feed.clientHeight >= feed.scrollHeight;
+let finished = false;
+let observer = null;
+let timer = null;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(timer);
+    const now = state();
+    done({previous: before, count: now.count, end: now.end});
+};
+const check = () => {
+    const now = state();
+    if (now.count > before || now.end) finish();
+};
+observer = new MutationObserver(check);
+observer.observe(feed, {childList: true, subtree: true});
+timer = setTimeout(finish, timeoutMs);
+if (nearBottom) check(); else finish();
+"""
+
+
+def scroll_and_wait(driver, feed, card_selector, scroll_by=None, timeout=FEED_WAIT_TIMEOUT):
+    """Scroll the feed and wait, in one round trip, until it grows or ends
+
+    scroll_by=None jumps to the bottom of the feed, a number scrolls by
+    that many pixels. Returns (card_count, grew, end_of_list).
+    """
+    result = driver.execute_async_script(
+        SCROLL_AND_WAIT_JS, feed, card_selector, scroll_by, END_OF_LIST_SELECTOR, int(timeout * 1000)
+    )
+    return result['count'], result['count'] > result['previous'], result['end']
@@ -0,0 +1,203 @@
+"""
+Capture of the internal search XHRs Google Maps fires while the results
+feed scrolls
+
+Scrolling div[role='feed'] loads more results through /search?tb=map
+requests whose bodies hold the structured place data (place ID, CID,
+coordinates, phone, website...). Chrome reports those responses as
+DevTools Network events in the performance log; the bodies are read back
+with Network.getResponseBody and decoded into card dicts shaped like
+maps_feed.extract_cards output, so every scraper's place_from_card works
+on them unchanged. Fields the DOM does not have travel in card['extra'].
+"""
+
+import json
+import logging
+import re
+
+from maps_feed import extract_cards
+
+logger = logging.getLogger(__name__)
+
+SEARCH_URL_RE = re.compile(r"/search\?tb=map")
+XSSI_PREFIX = ")]}'"
+JSON_SUFFIX = '/*""*/'
+
+# Where each field sits in a place array of the search payload. The
+# payload is an undocumented positional format, so the paths live here in
+# one table rather than in the decoding code.
+PLACE_FIELDS = {
+    'name': (11,),
+    'address': (39,),
+    'short_address': (18,),
+    'category': (13, 0),
+    'rating': (4, 7),
+    'reviews_count': (4, 8),
+    'price_range': (4, 2),
+    'website': (7, 0),
+    'phone': (178, 0, 0),
+    'latitude': (9, 2),
+    'longitude': (9, 3),
+    'data_id': (10,),
+    'place_id': (78,),
+}
+PLACE_INDEX = 14
+
+
+def enable_capture(chrome_options):
+    """Turn on the performance log that carries the DevTools Network events
+
+    SearchCapture reads the search XHRs from it, resource_blocking.BlockingReport
+    the traffic of the page.
+    """
+    chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    chrome_options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+
+
+def dig(value, path):
+    """Follow a path of list indexes, None as soon as one is missing"""
+    for index in path:
+        if not isinstance(value, list) or index >= len(value):
+            return None
+        value = value[index]
+    return value
+
+
+def load_payload(body):
+    """Parse a search response body, with or without the {"d": ...} wrapper"""
+    text = body.strip()
+    if text.endswith(JSON_SUFFIX):
+        text = text[:-len(JSON_SUFFIX)]
+    if text.startswith("{"):
+        text = json.loads(text).get("d", "")
+    if text.startswith(XSSI_PREFIX):
+        text = text[len(XSSI_PREFIX):]
+    return json.loads(text)
+
+
+def cid_from_data_id(data_id):
+    """The CID is the second half of a '0x...:0x...' feature id, as a decimal string"""
+    if not data_id or ":" not in data_id:
+        return None
+    try:
+        return str(int(data_id.split(":")[1], 16))
+    except ValueError:
+        return None
+
+
+def place_to_card(place):
+    """One place array of the payload as a card dict"""
+    fields = {name: dig(place, path) for name, path in PLACE_FIELDS.items()}
+    if not isinstance(fields['name'], str):
+        return None
+
+    rating = fields['rating']
+    reviews = fields['reviews_count']
+    rating_label = None
+    if rating is not None:
+        rating_label = f"{rating} stars"
+        if reviews is not None:
+            rating_label += f" {int(reviews):,} Reviews"
+
+    address = fields['address'] or fields['short_address']
+    google_url = None
+    if fields['place_id']:
+        google_url = f"https://www.google.com/maps/place/?q=place_id:{fields['place_id']}"
+
+    return {
+        'name': fields['name'],
+        'rating': str(rating) if rating is not None else None,
+        'rating_label': rating_label,
+        'address': address,
+        'phone': fields['phone'],
+        'website': fields['website'],
+        'hours': None,
+        'category': fields['category'],
+        'info': [text for text in (fields['price_range'], address) if text],
+        'google_url': google_url,
+        'extra': {
+            'place_id': fields['place_id'],
+            'data_id': fields['data_id'],
+            'cid': cid_from_data_id(fields['data_id']),
+            'latitude': fields['latitude'],
+            'longitude': fields['longitude'],
+            'reviews_count': int(reviews) if reviews is not None else None,
+        },
+    }
+
+
+def decode_search_payload(body):
+    """All places of one /search?tb=map response body as card dicts"""
+    try:
+        payload = load_payload(body)
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"Could not decode search payload: {e}")
+        return []
+
+    cards = []
+    for entry in dig(payload, (0, 1)) or []:
+        place = dig(entry, (PLACE_INDEX,))
+        if isinstance(place, list):
+            card = place_to_card(place)
+            if card:
+                cards.append(card)
+    return cards
+
+
+class SearchCapture:
+    """Reads the search XHR responses of one driver from its performance log"""
+
+    def __init__(self, driver, observer=None):
+        self.driver = driver
+        self.pending = {}
+        self.initial_read = False
+        # Called with every message read, since the log can only be read once
+        self.observer = observer
+        # Skip the search responses logged while the page itself was loading
+        self.read_log()
+
+    def read_log(self):
+        """Pending DevTools messages of the performance log"""
+        messages = [json.loads(entry["message"])["message"] for entry in self.driver.get_log("performance")]
+        if self.observer:
+            for message in messages:
+                self.observer(message)
+        return messages
+
+    def drain(self):
+        """Cards from every search response that finished since the last call"""
+        cards = []
+        for message in self.read_log():
+            method = message.get("method")
+            params = message.get("params", {})
+
+            if method == "Network.responseReceived":
+                url = params.get("response", {}).get("url", "")
+                if SEARCH_URL_RE.search(url):
+                    self.pending[params["requestId"]] = url
+
+            elif method == "Network.loadingFinished" and params.get("requestId") in self.pending:
+                url = self.pending.pop(params["requestId"])
+                try:
+                    body = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+                except Exception as e:
+                    logger.warning(f"Could not read search response {url}: {e}")
+                    continue
+                cards.extend(decode_search_payload(body.get("body", "")))
+
+            elif method == "Network.loadingFailed":
+                self.pending.pop(params.get("requestId"), None)
+
+        return cards
+
+    def next_cards(self, feed, card_selector):
+        """New cards since the last call
+
+        The first page of results is rendered with the page itself rather
+        than fetched by XHR, so the first call reads it from the DOM in one
+        batch; every later call only decodes captured responses.
+        """
+        if not self.initial_read:
+            self.initial_read = True
+            return extract_cards(self.driver, feed, card_selector)
+        return self.drain()
@@ -0,0 +1,274 @@
+"""
+Canonical place identity and the dedup index of the scrapers
+
+Places used to be deduplicated on f"{name}_{address}_{state}", which
+misses the same firm listed under two states (tiles and state searches
+overlap at borders) or spelled slightly differently, and was forgotten
+at the end of every run. place_key derives one id per place instead:
+the CID, read from the XHR payload or from the feature id in the card's
+a.hfpxzc link, else Google's place id, else a normalized name and
+address.
+
+PlaceIndex keeps those ids on disk across runs: an mmap-backed Bloom
+filter answers "never seen" without touching the exact set, and the
+exact set is SharedSeenSet, digests in append-only files split into
+key shards with one lock each. The scrapers check a card's id before
+extracting it, so places already scraped (in this run or an earlier
+one) cost no extraction.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from maps_xhr import cid_from_data_id
+
+SEEN_SHARDS = 16
+BLOOM_CAPACITY = 2_000_000
+BLOOM_ERROR_RATE = 0.001
+BLOOM_HEADER = struct.Struct("<8sQI")  # magic, bits, hashes
+BLOOM_MAGIC = b"PLBLOOM1"
+
+PLACE_LINK_SELECTOR = "a.hfpxzc"
+# Feature id "0x<cell>:0x<cid>" in the data= part of a /maps/place/ link
+FEATURE_ID_RE = re.compile(r"!1s(0x[0-9a-f]+:0x[0-9a-f]+)", re.IGNORECASE)
+CID_RE = re.compile(r"[?&]cid=(\d+)")
+PLACE_ID_RE = re.compile(r"(?:place_id:|!19s)(ChIJ[\w-]+)")
+
+# Spellings of the same address or firm name that should compare equal
+ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr',
+    'lane': 'ln', 'court': 'ct', 'place': 'pl', 'parkway': 'pkwy', 'highway': 'hwy',
+    'suite': 'ste', 'floor': 'fl', 'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'and': '&', 'company': 'co', 'incorporated': 'inc', 'limited': 'ltd',
+}
+
+
+def normalize(text):
+    """Lowercase ASCII words with punctuation dropped and common words abbreviated"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    words = re.findall(r"[a-z0-9&]+", text)
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def url_key(url):
+    """Canonical id found in a place link, or None"""
+    if not url:
+        return None
+    match = FEATURE_ID_RE.search(url)
+    cid = cid_from_data_id(match.group(1)) if match else None
+    if not cid:
+        match = CID_RE.search(url)
+        cid = match.group(1) if match else None
+    if cid:
+        return f"cid:{cid}"
+    match = PLACE_ID_RE.search(url)
+    return f"pid:{match.group(1)}" if match else None
+
+
+def place_key(card):
+    """Canonical id of a card dict or place record
+
+    CID first, since the XHR payload and the DOM link both carry it, then
+    Google's place id, then the normalized name and address. None when the
+    card has no name either.
+    """
+    extra = card.get('extra') or {}
+    cid = card.get('cid') or extra.get('cid') or cid_from_data_id(card.get('data_id') or extra.get('data_id'))
+    if cid:
+        return f"cid:{cid}"
+    key = url_key(card.get('google_url'))
+    if key:
+        return key
+    place_id = card.get('place_id') or extra.get('place_id')
+    if place_id:
+        return f"pid:{place_id}"
+    name = normalize(card.get('name'))
+    if not name:
+        return None
+    return f"name:{name}|{normalize(card.get('address'))}"
+
+
+def element_key(element):
+    """Canonical id from a card WebElement's place link, in one WebDriver round trip"""
+    try:
+        return url_key(element.find_element(By.CSS_SELECTOR, PLACE_LINK_SELECTOR).get_attribute("href"))
+    except NoSuchElementException:
+        return None
+
+
+def digest(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+
+
+class SeenSet:
+    """In-process, thread-safe set of place ids"""
+
+    def __init__(self):
+        self.keys = set()
+        self.lock = threading.Lock()
+
+    def add(self, key):
+        """Add a key; True when it was not there yet"""
+        with self.lock:
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+            return True
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class SharedSeenSet:
+    """Set of place ids shared by processes through append-only shard files
+
+    Each key is stored as a fixed-size digest in the shard file its digest
+    picks. A process keeps what it has read of every shard in memory and
+    only reads what other processes appended since, under the shard lock.
+    """
+
+    def __init__(self, root, locks):
+        self.root = root
+        self.locks = locks
+        self.known = [set() for _ in locks]
+        self.offsets = [0] * len(locks)
+        # The process locks order processes; threads of one process also need their own
+        self.thread_locks = [threading.Lock() for _ in locks]
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, shard):
+        return os.path.join(self.root, f"seen-{shard:02d}.txt")
+
+    def shard(self, key_digest):
+        return int(key_digest[:8], 16) % len(self.locks)
+
+    def refresh(self, shard, f):
+        """Read the digests appended to a shard since this process last looked"""
+        f.seek(self.offsets[shard])
+        data = f.read()
+        self.offsets[shard] += len(data)
+        self.known[shard].update(data.decode("ascii").split())
+
+    def add(self, key):
+        """Add a key; True when no process had added it before"""
+        key_digest = digest(key)
+        shard = self.shard(key_digest)
+        with self.thread_locks[shard], self.locks[shard]:
+            with open(self.path(shard), "a+b") as f:
+                self.refresh(shard, f)
+                if key_digest in self.known[shard]:
+                    return False
+                f.write(f"{key_digest}\n".encode("ascii"))
+                self.offsets[shard] = f.tell()
+            self.known[shard].add(key_digest)
+            return True
+
+    def load(self, shard):
+        """Catch up with a shard file, which may hold ids of earlier runs"""
+        with self.thread_locks[shard], self.locks[shard]:
+            if os.path.exists(self.path(shard)):
+                with open(self.path(shard), "rb") as f:
+                    self.refresh(shard, f)
+
+    def __contains__(self, key):
+        key_digest = digest(key)
+        shard = self.shard(key_digest)
+        if key_digest not in self.known[shard]:
+            self.load(shard)
+        return key_digest in self.known[shard]
+
+    def __len__(self):
+        for shard in range(len(self.locks)):
+            self.load(shard)
+        return sum(len(known) for known in self.known)
+
+
+class BloomFilter:
+    """Bloom filter over an mmap'ed file, shared by every process that maps it
+
+    Bits are only ever set, so a reader racing a writer can at worst miss a
+    key that is being added; PlaceIndex always confirms with the exact set.
+    Setting a bit rewrites its whole byte, so writers take one of `locks`
+    picked by the byte they touch; processes sharing the file must share
+    the locks too (multiprocessing locks), or a concurrent write can clear
+    a bit and a place already seen is extracted again.
+    """
+
+    def __init__(self, path, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE, locks=None):
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        size = BLOOM_HEADER.size + (bits + 7) // 8
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, bits, hashes))
+                f.truncate(size)
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, self.bits, self.hashes = BLOOM_HEADER.unpack_from(self.map)
+        if magic != BLOOM_MAGIC:
+            raise ValueError(f"{path} is not a place index Bloom filter")
+        self.locks = locks or [threading.Lock() for _ in range(SEEN_SHARDS)]
+
+    def positions(self, key):
+        h = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(h[:8], "little"), int.from_bytes(h[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for bit in self.positions(key):
+            offset = BLOOM_HEADER.size + bit // 8
+            with self.locks[offset % len(self.locks)]:
+                self.map[offset] |= 1 << (bit % 8)
+
+    def __contains__(self, key):
+        return all(self.map[BLOOM_HEADER.size + bit // 8] & (1 << (bit % 8)) for bit in self.positions(key))
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+class PlaceIndex:
+    """Persistent place id index: Bloom filter in front of the exact shard files
+
+    locks guard both the shard files and the filter's bytes; processes
+    sharing the index pass the same multiprocessing locks.
+    """
+
+    def __init__(self, root, locks=None, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        locks = locks or [threading.Lock() for _ in range(SEEN_SHARDS)]
+        self.exact = SharedSeenSet(root, locks)
+        self.bloom = BloomFilter(os.path.join(root, "bloom.bin"), capacity, error_rate, locks)
+
+    def add(self, key):
+        """Add a key; True when it was not in the index yet, in this run or an earlier one"""
+        added = self.exact.add(key)
+        self.bloom.add(key)
+        return added
+
+    def __contains__(self, key):
+        # Most cards of a search are new, and the filter rules those out without any file access
+        return key in self.bloom and key in self.exact
+
+    def __len__(self):
+        return len(self.exact)
+
+    def close(self):
+        self.bloom.close()
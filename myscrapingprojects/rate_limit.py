@@ -0,0 +1,91 @@
+"""
+Process-wide request pacing for the multithreaded Maps scrapers
+
+Every worker calls RateLimiter.acquire before a navigation or a scroll.
+A global token bucket caps the request rate of the whole process and one
+bucket per proxy session caps what a single exit IP sends, so adding
+workers raises throughput until the global budget is used up instead of
+each thread guessing its own sleeps.
+"""
+
+import random
+import threading
+import time
+
+# Whole process: one navigation or scroll per second on average
+GLOBAL_RATE = 1.0
+GLOBAL_BURST = 3
+# One proxy session (exit IP): one action every 4 seconds, like a reader
+SESSION_RATE = 0.25
+SESSION_BURST = 2
+JITTER = 1.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token, return how long to wait before using it
+
+        The token is taken even when the bucket is empty; the balance goes
+        negative and later callers queue up behind it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """A global bucket plus one bucket per proxy session, with optional jitter"""
+
+    def __init__(self, rate=GLOBAL_RATE, burst=GLOBAL_BURST, session_rate=SESSION_RATE,
+                 session_burst=SESSION_BURST, jitter=JITTER):
+        self.global_bucket = TokenBucket(rate, burst)
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.jitter = jitter
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.waited = 0.0
+        self.acquired = 0
+
+    def session_bucket(self, session):
+        with self.lock:
+            if session not in self.sessions:
+                self.sessions[session] = TokenBucket(self.session_rate, self.session_burst)
+            return self.sessions[session]
+
+    def acquire(self, session=None):
+        """Block until both the session and the global budget allow one more request
+
+        Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        # The session first, so a slow session does not hold a global token while it waits
+        if session is not None:
+            waited += self.sleep(self.session_bucket(session).reserve())
+        waited += self.sleep(self.global_bucket.reserve() + random.uniform(0, self.jitter))
+        with self.lock:
+            self.waited += waited
+            self.acquired += 1
+        return waited
+
+    @staticmethod
+    def sleep(seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.acquired, 'seconds_waited': round(self.waited, 1), 'sessions': len(self.sessions)}
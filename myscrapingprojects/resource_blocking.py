@@ -0,0 +1,125 @@
+"""
+Resource blocking for the proxied Maps scrapers
+
+Every byte a proxied browser loads is billed by the proxy provider, and
+map tiles, place photos and web fonts make up most of a Maps page while
+no extractor reads them. Network.setBlockedURLs drops those requests
+inside Chrome before they reach the proxy. The blocklist is checked
+against sample URLs of the data the scrapers do read (page, scripts,
+search XHRs), so no pattern can take out the feed.
+
+BlockingReport tallies the DevTools Network events of the performance
+log (turned on with maps_xhr.enable_capture): bytes actually transferred,
+and blocked requests by resource type, with an estimate of the bytes they
+would have cost.
+"""
+
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+BLOCKED_URL_PATTERNS = [
+    # Images: place photos, avatars, icons, map sprites
+    "*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.ico*",
+    "*googleusercontent.com/*",
+    # Web fonts
+    "*.woff*", "*.ttf*", "*.otf*",
+    "*fonts.gstatic.com/*", "*fonts.googleapis.com/*",
+    # Map tiles, satellite tiles and street view
+    "*/maps/vt*", "*/kh/v=*", "*khms*.google.*",
+    "*streetviewpixels-pa.googleapis.com/*",
+]
+
+# Requests the scrapers depend on; a blocked pattern matching any of them is dropped
+ALLOWED_URLS = [
+    "https://www.google.co.in/maps/search/estate+planning+firm+Texas+USA",
+    "https://www.google.co.in/search?tb=map&authuser=0&hl=en&q=estate+planning+firm",
+    "https://www.google.co.in/maps/preview/place?authuser=0&hl=en&pb=!1m1",
+    "https://www.google.co.in/maps/_/js/k=maps.m.en.abc/m=sc2,per,mo,lp/am=AAA/rs=ACT90",
+    "https://maps.gstatic.com/maps-api-v3/api/js/55/1/intl/en_gb/common.js",
+]
+
+# Typical transfer size of a blocked request, by DevTools resource type.
+# Blocked requests are never downloaded, so their cost can only be estimated.
+ESTIMATED_BYTES = {
+    "Image": 25_000,
+    "Font": 40_000,
+    "Fetch": 15_000,
+    "XHR": 15_000,
+    "Other": 10_000,
+}
+
+
+def pattern_regex(pattern):
+    """setBlockedURLs pattern as a regex: '*' matches anything, the rest is literal"""
+    return re.compile(".*".join(re.escape(part) for part in pattern.split("*")) + r"\Z")
+
+
+def blocked_url_patterns(extra_patterns=(), allowed_urls=ALLOWED_URLS):
+    """The blocklist plus extra_patterns, minus anything that matches an allowed URL"""
+    patterns = []
+    for pattern in [*BLOCKED_URL_PATTERNS, *extra_patterns]:
+        regex = pattern_regex(pattern)
+        hits = [url for url in allowed_urls if regex.match(url)]
+        if hits:
+            logger.warning(f"Not blocking {pattern}: it matches feed data ({hits[0]})")
+            continue
+        patterns.append(pattern)
+    return patterns
+
+
+def block_resources(driver, patterns=None):
+    """Apply the blocklist to a running driver"""
+    patterns = blocked_url_patterns() if patterns is None else patterns
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    return patterns
+
+
+class BlockingReport:
+    """Transferred and blocked traffic of one page"""
+
+    def __init__(self):
+        self.transferred_bytes = 0
+        self.requests = 0
+        self.blocked = {}
+
+    def observe(self, message):
+        """Account for one DevTools message of the performance log"""
+        method = message.get("method")
+        params = message.get("params", {})
+        if method == "Network.loadingFinished":
+            self.requests += 1
+            self.transferred_bytes += int(params.get("encodedDataLength", 0))
+        elif method == "Network.loadingFailed" and params.get("blockedReason"):
+            resource_type = params.get("type", "Other")
+            self.blocked[resource_type] = self.blocked.get(resource_type, 0) + 1
+
+    def collect(self, driver):
+        """Read whatever is pending in the driver's performance log"""
+        for entry in driver.get_log("performance"):
+            self.observe(json.loads(entry["message"])["message"])
+
+    @property
+    def blocked_requests(self):
+        return sum(self.blocked.values())
+
+    @property
+    def estimated_bytes_saved(self):
+        return sum(count * ESTIMATED_BYTES.get(resource_type, ESTIMATED_BYTES["Other"])
+                   for resource_type, count in self.blocked.items())
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'transferred_bytes': self.transferred_bytes,
+            'blocked_requests': self.blocked_requests,
+            'blocked_by_type': dict(self.blocked),
+            'estimated_bytes_saved': self.estimated_bytes_saved,
+        }
+
+    def summary(self):
+        return (f"{self.transferred_bytes / 1e6:.2f} MB over {self.requests} requests, "
+                f"{self.blocked_requests} blocked (~{self.estimated_bytes_saved / 1e6:.2f} MB saved)")
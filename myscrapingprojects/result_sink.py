@@ -0,0 +1,267 @@
+"""
+Streaming result output for the scrapers
+
+save_to_csv used to build one pandas DataFrame from the whole result list
+after the run, so memory grew with the result count and nothing reached
+disk until the end. ResultSink takes records as the workers produce them:
+a single writer thread drains a queue and appends them in batches, as
+CSV rows, JSON lines or Parquet row groups depending on the file
+extension. Running counters replace the summary the DataFrame was used
+for.
+
+The columns of each record type are declared up front (ESTATE_FIELDS,
+PLACE_FIELDS, MAPS_FIELDS) rather than taken from the first batch, whose cards may
+lack the XHR-only fields or have them all empty. Values are coerced to
+the declared type; a field that is not declared is left out of CSV and
+Parquet (with a warning), JSONL keeps every field. A batch the output
+file cannot take is saved to a .failed.jsonl file next to it.
+"""
+
+import csv
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5.0  # seconds a partial batch may wait before it is written
+FLUSH = object()      # stands in for a record when the flush interval runs out
+
+# Fields decoded from the search XHRs (maps_xhr.place_to_card 'extra'); DOM-only cards leave them empty
+XHR_FIELDS = [
+    ('place_id', 'string'),
+    ('data_id', 'string'),
+    ('cid', 'string'),
+    ('latitude', 'float64'),
+    ('longitude', 'float64'),
+    ('reviews_count', 'int64'),
+]
+
+# (name, type) columns of the estate scrapers' place records
+ESTATE_FIELDS = [
+    ('name', 'string'),
+    ('rating', 'string'),
+    ('address', 'string'),
+    ('phone', 'string'),
+    ('website', 'string'),
+    ('hours', 'string'),
+    ('state', 'string'),
+    ('state_source', 'string'),
+    ('place_key', 'string'),
+    ('thread_id', 'int64'),
+    ('session_id', 'string'),
+    ('scraped_at', 'string'),
+] + XHR_FIELDS
+
+# (name, type) columns of estate.py's and estate_delays.py's place records
+PLACE_FIELDS = [
+    ('name', 'string'),
+    ('rating', 'string'),
+    ('address', 'string'),
+] + XHR_FIELDS
+
+# (name, type) columns of googlemaps.py's place records
+MAPS_FIELDS = [
+    ('name', 'string'),
+    ('rating', 'string'),
+    ('address', 'string'),
+    ('price_range', 'string'),
+    ('category', 'string'),
+    ('hours_status', 'string'),
+    ('description', 'string'),
+    ('google_url', 'string'),
+] + XHR_FIELDS
+
+
+def coerce(value, kind):
+    """A record value as the column type, None when it does not convert"""
+    if value is None or value == "":
+        return None
+    try:
+        if kind == 'int64':
+            return int(str(value).replace(",", "")) if isinstance(value, str) else int(value)
+        if kind == 'float64':
+            return float(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Could not read {value!r} as {kind}, left empty")
+        return None
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+class UndeclaredFields:
+    """Warns once about every record field that has no column"""
+
+    def __init__(self, fields):
+        self.names = {name for name, _ in fields}
+        self.warned = set()
+
+    def check(self, records):
+        extra = {key for record in records for key in record} - self.names - self.warned
+        if extra:
+            logger.warning(f"Fields {sorted(extra)} have no column and are left out")
+            self.warned |= extra
+
+
+class CSVWriter:
+    def __init__(self, filename, fields):
+        self.file = open(filename, "w", newline="", encoding="utf-8")
+        self.fields = fields
+        self.undeclared = UndeclaredFields(fields)
+        self.writer = csv.DictWriter(self.file, [name for name, _ in fields], extrasaction="ignore")
+        self.writer.writeheader()
+        self.file.flush()
+
+    def write_batch(self, records):
+        self.undeclared.check(records)
+        self.writer.writerows({name: coerce(record.get(name), kind) for name, kind in self.fields}
+                              for record in records)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLWriter:
+    def __init__(self, filename, fields=None):
+        self.file = open(filename, "w", encoding="utf-8")
+
+    def write_batch(self, records):
+        self.file.writelines(json.dumps(record, default=str) + "\n" for record in records)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """One row group per batch, in the schema of the declared fields"""
+
+    def __init__(self, filename, fields):
+        # Only Parquet output needs pyarrow
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {'string': pa.string(), 'int64': pa.int64(), 'float64': pa.float64()}
+        self.pa = pa
+        self.fields = fields
+        self.undeclared = UndeclaredFields(fields)
+        self.schema = pa.schema([(name, types[kind]) for name, kind in fields])
+        self.writer = pq.ParquetWriter(filename, self.schema)
+
+    def write_batch(self, records):
+        self.undeclared.check(records)
+        columns = {name: [coerce(record.get(name), kind) for record in records] for name, kind in self.fields}
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    ".csv": CSVWriter,
+    ".jsonl": JSONLWriter,
+    ".parquet": ParquetWriter,
+}
+
+
+class ResultSink:
+    """Appends records to a file from one writer thread, keeping running counts
+
+    fields are the (name, type) columns of the records, ESTATE_FIELDS,
+    PLACE_FIELDS or MAPS_FIELDS; types are 'string', 'int64' or 'float64'.
+    """
+
+    def __init__(self, filename, fields, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        extension = filename[filename.rfind("."):].lower() if "." in filename else ""
+        if extension not in WRITERS:
+            raise ValueError(f"Unsupported output format {extension!r}, use one of {sorted(WRITERS)}")
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writer = WRITERS[extension](filename, fields)
+        self.failed_filename = filename[:len(filename) - len(extension)] + ".failed.jsonl"
+        self.failed_writer = None
+        self.failed = 0
+        self.queue = queue.Queue()
+        self.total = 0
+        self.by_state = Counter()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="ResultSink", daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        self.queue.put(record)
+
+    def write_many(self, records):
+        for record in records:
+            self.queue.put(record)
+
+    def run(self):
+        batch = []
+        deadline = None
+        while True:
+            # A batch is written when full, or flush_interval after its first record
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = FLUSH
+            if record is not None and record is not FLUSH:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+            if batch and (record is None or record is FLUSH or len(batch) >= self.batch_size):
+                self.write_batch(batch)
+                batch = []
+                deadline = None
+            if record is None:
+                return
+
+    def write_batch(self, batch):
+        try:
+            self.writer.write_batch(batch)
+        except Exception as e:
+            # Kept as JSON lines instead, which takes any record
+            logger.error(f"Could not write {len(batch)} records to {self.filename}: {e}; "
+                         f"saving them to {self.failed_filename}")
+            if self.failed_writer is None:
+                self.failed_writer = JSONLWriter(self.failed_filename)
+            self.failed_writer.write_batch(batch)
+            with self.lock:
+                self.failed += len(batch)
+            return
+        with self.lock:
+            self.total += len(batch)
+            self.by_state.update(record.get('state') for record in batch if record.get('state'))
+
+    def close(self):
+        """Write what is queued and close the file"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        logger.info(f"Data saved to {self.filename} ({self.total} records)")
+        if self.failed_writer:
+            self.failed_writer.close()
+            logger.error(f"{self.failed} records could not be written and are in {self.failed_filename}")
+
+    def summary(self):
+        with self.lock:
+            return {
+                'total_places': self.total,
+                'unique_states': len(self.by_state),
+                'places_by_state': dict(self.by_state),
+                'failed_records': self.failed,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
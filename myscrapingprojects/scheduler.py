@@ -0,0 +1,162 @@
+"""
+Work scheduling for the multithreaded Maps scrapers
+
+Scheduler keeps max_workers searches in flight, pulling the next one
+from a shared queue whenever a worker frees up, so small states that
+finish early hand their thread to the next state instead of idling
+behind a fixed submission order. Tasks may be added while it runs (the
+tile planner splits full cells), and results are handled in completion
+order.
+
+ResultBudget replaces the fixed max_results // len(states) quota: each
+task is granted a fair share of what is left when it starts, unused
+quota flows back when it finishes, and once the global target is met
+the stop event tells running searches to wrap up and nothing new starts.
+SharedResultBudget is the same budget across the sharded processes.
+"""
+
+import concurrent.futures
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """Thread-safe FIFO of tasks shared by the workers"""
+
+    def __init__(self, tasks=()):
+        self.tasks = deque(tasks)
+        self.lock = threading.Lock()
+
+    def put(self, task):
+        with self.lock:
+            self.tasks.append(task)
+
+    def next_task(self):
+        """Next task, or None when the queue is empty"""
+        with self.lock:
+            return self.tasks.popleft() if self.tasks else None
+
+    def __len__(self):
+        return len(self.tasks)
+
+
+class ResultBudget:
+    """Global result target shared by all tasks"""
+
+    def __init__(self, max_results, stop_event=None, collected=0):
+        self.max_results = max_results
+        self.collected = collected  # results already in hand, e.g. from a resumed run
+        self.reserved = 0
+        self.stop = stop_event or threading.Event()
+        self.lock = threading.Lock()
+        if self.collected >= self.max_results:
+            self.stop.set()
+
+    @property
+    def exhausted(self):
+        return self.stop.is_set()
+
+    def reserve(self, tasks_left):
+        """Quota for a starting task: an even share of the budget nobody holds yet"""
+        with self.lock:
+            free = max(0, self.max_results - self.collected - self.reserved)
+            quota = max(1, -(-free // max(1, tasks_left)))
+            self.reserved += quota
+            return quota
+
+    def settle(self, quota, used):
+        """A task finished with `used` results; the rest of its quota is free again"""
+        with self.lock:
+            self.reserved -= quota
+            self.collected += used
+            if self.collected >= self.max_results:
+                self.stop.set()
+
+    def stats(self):
+        with self.lock:
+            return {'max_results': self.max_results, 'collected': self.collected, 'reserved': self.reserved}
+
+
+class SharedResultBudget(ResultBudget):
+    """ResultBudget shared by processes: the counts live in shared memory
+
+    Built from a multiprocessing context and handed to the pool processes
+    when they start, so every process draws on one global target and one
+    stop event.
+    """
+
+    def __init__(self, context, max_results, collected=0):
+        self.counts = context.Array('q', [0, 0])  # collected, reserved
+        super().__init__(max_results, context.Event(), collected)
+        self.lock = self.counts.get_lock()
+
+    @property
+    def collected(self):
+        return self.counts[0]
+
+    @collected.setter
+    def collected(self, value):
+        self.counts[0] = value
+
+    @property
+    def reserved(self):
+        return self.counts[1]
+
+    @reserved.setter
+    def reserved(self, value):
+        self.counts[1] = value
+
+
+class Scheduler:
+    """Runs tasks from a shared queue on max_workers threads under a ResultBudget
+
+    run_task(task, quota) returns (results, info) and runs on a worker
+    thread; on_done(task, results, info) runs on the calling thread as
+    tasks complete and may put more tasks on the queue.
+    """
+
+    def __init__(self, max_workers, budget):
+        self.max_workers = max_workers
+        self.budget = budget
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def run(self, queue, run_task, on_done):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while True:
+                # Only as many tasks as free workers are submitted, the rest wait in the shared queue
+                while len(running) < self.max_workers and not self.budget.exhausted:
+                    task = queue.next_task()
+                    if task is None:
+                        break
+                    quota = self.budget.reserve(len(queue) + 1)
+                    running[executor.submit(run_task, task, quota)] = (task, quota)
+                if not running:
+                    break
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task, quota = running.pop(future)
+                    try:
+                        results, info = future.result()
+                    except Exception as e:
+                        logger.error(f"Task {task} failed: {e}")
+                        self.failed += 1
+                        self.budget.settle(quota, 0)
+                        continue
+                    self.completed += 1
+                    self.budget.settle(quota, len(results))
+                    on_done(task, results, info)
+
+            if self.budget.exhausted:
+                self.cancelled = len(queue)
+                logger.info(f"Result budget reached, {self.cancelled} queued tasks cancelled")
+
+    def stats(self):
+        return {'completed': self.completed, 'failed': self.failed, 'cancelled': self.cancelled,
+                **self.budget.stats()}
@@ -0,0 +1,140 @@
+"""
+Multi-process sharding of the state scrape
+
+One Python process serializes extraction, JSON decoding, logging and
+dedup of every worker thread on the GIL. run_sharded splits the states
+across a process pool instead; every process builds its own scraper
+(with its own thread and driver pool) and scrapes its shard with
+scrape_estate_firms_parallel.
+
+Dedup across processes goes through a place_index.PlaceIndex: its
+exact set is kept in append-only files, one per key shard with its own
+lock, so processes only contend when they hit the same shard at the same
+moment, and its Bloom filter is an mmap every process shares. The result
+target is a scheduler.SharedResultBudget all processes draw on.
+Finished states stream back to the parent through a queue and are
+merged by a collector thread as they arrive.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+from checkpoint import CheckpointStore
+from place_index import SEEN_SHARDS, PlaceIndex
+from rate_limit import RateLimiter
+from scheduler import SharedResultBudget
+
+logger = logging.getLogger(__name__)
+
+# Set in every pool process by init_worker
+worker_queue = None
+worker_seen = None
+worker_budget = None
+
+
+def shard(items, count):
+    """Deal items round robin into `count` non-empty shards"""
+    return [items[i::count] for i in range(min(count, len(items)))]
+
+
+def init_worker(queue, locks, seen_dir, budget):
+    global worker_queue, worker_seen, worker_budget
+    worker_queue = queue
+    worker_seen = PlaceIndex(seen_dir, locks)
+    worker_budget = budget
+
+
+def scrape_shard(scraper_class, config, states, query, max_results):
+    """Scrape one shard of states in a pool process, streaming each finished state"""
+    scraper = scraper_class(**config['init'], rate_limiter=RateLimiter(**config['rate_limiter']))
+    scraper.proxy_config = config['proxy_config']
+    scraper.seen_places = worker_seen
+    # Opened as is: the parent already emptied the checkpoint or resumed from it
+    if config['checkpoint_path']:
+        scraper.checkpoint = CheckpointStore(config['checkpoint_path'])
+
+    def on_results(state, results):
+        worker_queue.put(("results", (state, results)))
+
+    scraper.scrape_estate_firms_parallel(query, max_results, states=states, on_results=on_results,
+                                         budget=worker_budget)
+    worker_queue.put(("traffic", scraper.traffic_reports))
+    return len(states)
+
+
+class ResultCollector(threading.Thread):
+    """Merges what the pool processes stream back, as it arrives"""
+
+    def __init__(self, queue, on_results, on_traffic=None):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.on_results = on_results
+        self.on_traffic = on_traffic
+        self.states = 0
+        self.places = 0
+
+    def run(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            kind, payload = message
+            if kind == "results":
+                state, results = payload
+                self.states += 1
+                self.places += len(results)
+                self.on_results(state, results)
+            elif kind == "traffic" and self.on_traffic:
+                self.on_traffic(payload)
+
+
+def run_sharded(scraper_class, config, states, query, max_results, processes=None,
+                on_results=None, on_traffic=None, seen_dir=None, seen_keys=(), collected=0):
+    """Scrape `states` across `processes` OS processes; returns (states done, places)
+
+    max_results is the target of the whole run, of which `collected` are
+    already in hand. seen_keys are place ids every process should treat as
+    already scraped.
+    """
+    processes = processes or os.cpu_count() or 1
+    shards = shard(states, processes)
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    locks = [context.Lock() for _ in range(SEEN_SHARDS)]
+    budget = SharedResultBudget(context, max_results, collected)
+    cleanup = seen_dir is None
+    seen_dir = seen_dir or tempfile.mkdtemp(prefix="seen_places_")
+    seen = PlaceIndex(seen_dir, locks)
+    for key in seen_keys:
+        seen.add(key)
+    seen.close()
+
+    collector = ResultCollector(queue, on_results, on_traffic)
+    collector.start()
+    logger.info(f"Sharding {len(states)} states across {len(shards)} processes")
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(len(shards), mp_context=context, initializer=init_worker,
+                                                    initargs=(queue, locks, seen_dir, budget)) as pool:
+            futures = {
+                pool.submit(scrape_shard, scraper_class, config, states_shard, query, max_results):
+                    states_shard for states_shard in shards
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Shard {futures[future]} failed: {e}")
+    finally:
+        queue.put(None)
+        collector.join()
+        if cleanup:
+            shutil.rmtree(seen_dir, ignore_errors=True)
+
+    logger.info(f"Result budget: {budget.stats()}")
+    return collector.states, collector.places
@@ -0,0 +1,33 @@
+"""Smoke test: the scheduler drives a TilePlanner like any other task queue"""
+
+from geo_tiles import RESULT_CAP, TilePlanner
+from scheduler import ResultBudget, Scheduler
+
+
+def test_scheduler_runs_tile_planner():
+    planner = TilePlanner(['Rhode Island'], max_depth=1)
+    initial = planner.planned
+    scheduler = Scheduler(2, ResultBudget(10_000))
+    done = []
+
+    def run_tile(tile, quota):
+        # Every top-level cell comes back full, so each one is split once
+        cards = RESULT_CAP if tile.depth == 0 else 5
+        return [f"{tile.label} #{i}" for i in range(2)], cards
+
+    def tile_done(tile, results, cards_seen):
+        planner.report(tile, cards_seen)
+        done.append(tile)
+
+    scheduler.run(planner, run_tile, tile_done)
+
+    assert len(done) == initial * 5
+    assert planner.stats() == {'tiles_planned': initial * 5, 'tiles_searched': initial * 5,
+                               'splits': initial, 'tiles_pending': 0}
+    assert scheduler.stats()['completed'] == initial * 5
+    assert scheduler.stats()['collected'] == initial * 5 * 2
+
+
+if __name__ == "__main__":
+    test_scheduler_runs_tile_planner()
+    print("ok")